@@ -1,15 +1,37 @@
+import atexit
+import bisect
 import click
-import coverpy
+import csv
+import fcntl
+import functools
+import hashlib
+import json
+import mmap
+import numpy as np
 import os
 import pyglet as pg
+import queue
 import random
 import requests
+import resource
+import select
+import shutil
+import sqlite3
+import stat
+import struct
 import subprocess
 import sys
+import tempfile
+import threading
 import youtube_dl
+from datetime import datetime
 from decimal import Decimal
-from time import time
-from collections import deque
+from time import time, sleep, perf_counter, process_time, monotonic
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Constantes
 ############
@@ -36,6 +58,15 @@ TIMER_BAR_WIDTH = TIMER_GAP_WIDTH - 2
 TIMER_BAR_HEIGHT = TIMER_GAP_HEIGHT - 2
 DISPLAY_WINDOW_WIDTH = 1200
 DISPLAY_WINDOW_HEIGHT = 900
+COVER_HEIGHT_RATIO = 0.7 # hauteur de la pochette sur l'afficheur, par rapport à la fenêtre
+COVER_ATLAS_MAX_PAGE_SIZE = 8192 # côté maximal d'une page de l'atlas des pochettes, même si la carte accepte plus
+COVER_ATLAS_PADDING = 2 # marge entre deux pochettes, contre le débordement du filtrage
+COVER_ATLAS_MAX_COVER_SIZE = COVER_ATLAS_MAX_PAGE_SIZE - COVER_ATLAS_PADDING # au moins une pochette par page
+COVER_ATLAS_RESIDENT_PAGES = 2
+GIF_RESIDENT = 5 # animations gardées décodées et sur le GPU
+GIF_PREFETCH_RADIUS = 1
+GIF_RESIZE_DELAY = 0.3 # secondes sans redimensionnement avant de réduire à nouveau les GIF
+GIF_MAX_FRAMES = 100 # au-delà, les images d'un GIF sont regroupées
 
 BUZZER_FX = "buzzer2.wav"
 SUCCESS_FX = "success4.wav"
@@ -48,6 +79,47 @@ DEFAULT_FADEOUT_FACTOR = 0.8
 DEFAULT_ANSWER_TIMER_DURATION = 3
 DEFAULT_RETRY_MODE = RETRY_MODE_STRICT
 DEFAULT_RETRY_TIMER_DURATION = 5
+DEFAULT_AUDIO_CACHE_MB = 1024
+DEFAULT_PREFETCH_RADIUS = 2
+MEDIA_LOAD_ATTEMPTS = 3 # chargements d'une même piste par get_media, si le résultat est périmé avant d'être lu
+DEFAULT_PCM_CACHE_MB = 8192
+DEFAULT_DOWNLOAD_JOBS = 4
+DEFAULT_DOWNLOAD_RETRIES = 2
+DEFAULT_RESOLVE_JOBS = 8
+COVER_SEARCH_URL = "https://itunes.apple.com/search" # la recherche d'iTunes, celle qu'interrogeait coverpy
+COVER_SIZE = 800
+COVER_LOOKUP_TTL = 30 * 24 * 3600 # secondes pendant lesquelles une pochette trouvée n'est pas recherchée à nouveau
+COVER_MISS_TTL = 7 * 24 * 3600 # une recherche sans résultat est retentée plus tôt
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 3
+DEFAULT_AUDIO_CODEC = "mp3"
+DEFAULT_AUDIO_BITRATE = "320k"
+FRAME_STATS_INTERVAL = 10
+ANIMATION_FRAME_INTERVAL = 1/60
+POSITION_CHECK_INTERVAL = 0.25
+JOYSTICK_SCAN_INTERVAL = 2 # secondes entre deux recherches de boîtiers branchés en cours de partie
+RELOAD_CHECK_INTERVAL = 2 # secondes entre deux vérifications de la playlist et des équipes, avec --watch
+DEFAULT_INPUT_BACKEND = "pyglet"
+DEFAULT_ARBITRATION_WINDOW_MS = 15
+SFX_VOICES = 2 # lecteurs préparés par effet, pour qu'un effet puisse se superposer à lui-même
+LATENCY_HISTORY = 500 # mesures gardées par bouton pour les percentiles de check --latency
+LATENCY_REPORT_INTERVAL = 5
+METRICS_HISTORY = 600 # mesures gardées par série pour les percentiles
+METRICS_OVERLAY_INTERVAL = 1
+DEFAULT_METRICS_INTERVAL = 10
+REPLAY_DRIVE_INTERVAL = 0.1 # rythme auquel le rejeu relance les pistes et reprend après les buzz
+REPLAY_ANSWER_DELAY = 0.3 # durée d'une « réponse » pendant le rejeu, avant de reprendre la piste
+REPLAY_GRACE = 1 # attente des derniers événements postés, après la fin du rejeu
+REPLAY_RELEASE_DELAY = 0.05
+DEFAULT_LATE_MS = 50
+SNAPSHOT_SIZE = 64 * 1024 # mémoire partagée avec les afficheurs séparés
+SNAPSHOT_HEADER = struct.Struct("<QI") # numéro de version, longueur du JSON
+SNAPSHOT_POLL_INTERVAL = 1/60
+BENCH_STEP_INTERVAL = 0.25 # rythme de la partie scriptée de `bench`
+BENCH_BUZZES_PER_TRACK = 3
+BENCH_TEAMS = 4
+FADE_OUT_STEP = 0.1 # le volume est multiplié par le facteur de fondu à chaque pas
+FADE_OUT_FLOOR = 0.01 # volume en dessous duquel la piste est coupée
 
 NUMBER_KEYS = (pg.window.key._1, pg.window.key._2, pg.window.key._3, pg.window.key._4, pg.window.key._5,
                pg.window.key._6, pg.window.key._7, pg.window.key._8, pg.window.key._9)
@@ -62,6 +134,15 @@ COLOR_WHITE = "#FFFFFF"
 ASSETS_DIR = "assets" # pyglet ne supporte pas les chemins absolus
 COVERS_DIR = "covers"
 TRACKS_DIR = "tracks"
+ANALYSIS_FILE = os.path.join(TRACKS_DIR, "analysis.json")
+INDEX_FILE = "index.sqlite"
+DEVICES_FILE = "devices.json" # numéro de chaque boîtier, par identifiant stable
+PCM_CACHE_DIR = os.path.join("cache", "pcm")
+COVER_ATLAS_DIR = os.path.join("cache", "atlas")
+STORE_DIR = "store"
+COVER_LOOKUP_FILE = os.path.join("cache", "covers.json")
+SEARCH_CACHE_FILE = os.path.join("cache", "searches.json")
+COVER_IMAGE_CACHE_DIR = os.path.join("cache", "covers")
 FX_DIR = os.path.join(ASSETS_DIR, "fx")
 GIFS_DIR = os.path.join(ASSETS_DIR, "gifs")
 IMAGES_DIR = os.path.join(ASSETS_DIR, "images")
@@ -70,66 +151,877 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__)) # utile pour créer des li
 MAX_PLAYLIST_ENTRIES = 23
 PLAYLIST_BUFFER_LINES = 4
 
-# Fonctions utilitaires
+PCM_HEADER = struct.Struct("<4sHHI") # signature, canaux, bits par échantillon, fréquence
+PCM_MAGIC = b"BPCM"
+
+EVDEV_EVENT = struct.Struct("llHHi") # struct input_event : secondes, microsecondes, type, code, valeur
+EV_KEY = 0x01
+KEY_CNT = 0x300
+BTN_JOYSTICK = 0x120
+EVIOCGBIT_KEY = (2 << 30) | ((KEY_CNT // 8) << 16) | (ord("E") << 8) | (0x20 + EV_KEY) # _IOC(_IOC_READ, 'E', 0x20+EV_KEY, len)
+
+INGEST_SAMPLE_RATE = 44100
+INGEST_CHANNELS = 2
+SILENCE_THRESHOLD = 0.001 # fraction de l'amplitude maximale, comme "0.1%" pour sox
+SILENCE_MIN_SOUND_DURATION = 0.1 # durée de son continu qui marque la fin du silence initial
+
+AUDIO_CODECS = {"mp3": ("libmp3lame", "mp3"), # codec : (encodeur FFmpeg, extension)
+                "vorbis": ("libvorbis", "ogg"),
+                "opus": ("libopus", "opus"),
+                "aac": ("aac", "m4a"),
+                "flac": ("flac", "flac")}
+
+TARGET_LOUDNESS = -18 # dBFS ; les pistes plus fortes sont atténuées, les plus faibles restent au maximum
+LOUDNESS_BLOCK_DURATION = 0.4
+LOUDNESS_ABSOLUTE_GATE = -70
+LOUDNESS_RELATIVE_GATE = -10
+HOOK_COUNT = 5
+HOOK_WINDOW_DURATION = 4 # secondes d'énergie moyennée autour d'un refrain potentiel
+HOOK_MIN_GAP = 15 # secondes minimum entre deux points d'accroche
+HOOK_RANGE = (0.1, 0.9) # ni trop au début, ni trop à la fin
 
-def download_audio(track=None, video_id=None):
-    output_file = os.path.join(TRACKS_DIR, f"{track}.mp3")
+# Fonctions utilitaires
 
+def parse_playlist_line(line):
+    line = line.strip()
+    if "=" in line:
+        track, video_id = line.split("=")
+    else:
+        track, video_id = line, None
+    return track, video_id
+
+def parse_team_line(line):
+    fields = line.strip().split(":")
+    name, button = fields[0], fields[1]
+    if "@" in button: # bouton@boîtier, le boîtier 1 par défaut
+        button_id, device = (int(field) for field in button.split("@"))
+    else:
+        button_id, device = int(button), 1
+    if len(fields) == 3:
+        score = int(fields[2])
+    else:
+        score = 0
+    return Team(name=name, score=score, button_id=button_id, device=device)
+
+def split_track_name(track):
+    artist, title = track.split(" - ")
+    if "/" in artist:
+        artist = artist.split("/")[-1]
+    return artist, title
+
+def find_track_file(track):
+    for _, extension in AUDIO_CODECS.values():
+        path = os.path.join(TRACKS_DIR, f"{track}.{extension}")
+        if os.path.isfile(path):
+            return path
+    return os.path.join(TRACKS_DIR, f"{track}.mp3")
+
+def fetch_audio(track, video_id, work_dir, skip=None):
+    # renvoie (fichier, video_id) ; fichier vaut None si skip(video_id) dit que la vidéo trouvée est déjà stockée
     if not video_id:
         query = f"ytsearch:{track}"
     else:
         query = f"https://www.youtube.com/watch?v={video_id}"
 
-    ydl_opts = {"outtmpl": r"temp_audio.%(ext)s",
+    # un essai précédent a pu laisser un fichier partiel ou dans un autre format
+    for name in os.listdir(work_dir):
+        path = os.path.join(work_dir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+    # flux d'origine, sans conversion : il ne sera décodé qu'une fois, à l'ingestion
+    ydl_opts = {"outtmpl": os.path.join(work_dir, "audio.%(ext)s"),
                 "quiet": True,
-                "format": "bestaudio/best",
-                "postprocessors": [{
-                    "key": "FFmpegExtractAudio",
-                    "preferredcodec": "mp3",
-                    "preferredquality": "320"
-                }]}
+                "format": "bestaudio/best"}
     with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-        ydl.download([query])
+        info = ydl.extract_info(query, download=False)
+        if "entries" in info: # résultat d'une recherche
+            info = info["entries"][0]
+        if skip and skip(info["id"]):
+            return None, info["id"]
+        ydl.process_info(info) # info porte déjà le format choisi, et donc l'extension du fichier final
+        audio_file = ydl.prepare_filename(info)
+    if not os.path.isfile(audio_file):
+        raise RuntimeError(f"téléchargement incomplet ({os.path.basename(audio_file)} absent)")
+
+    print(f"[{track}] Son téléchargé.")
+    return audio_file, info["id"]
+
+def decode_audio(input_file):
+    result = subprocess.run(["ffmpeg", "-v", "error",
+                             "-i", input_file,
+                             "-f", "s16le",
+                             "-ac", str(INGEST_CHANNELS),
+                             "-ar", str(INGEST_SAMPLE_RATE),
+                             "-"],
+                            stdout=subprocess.PIPE,
+                            check=True)
+    return np.frombuffer(result.stdout, dtype=np.int16).reshape(-1, INGEST_CHANNELS)
+
+def leading_silence(samples):
+    # premier échantillon suivi d'au moins SILENCE_MIN_SOUND_DURATION de son ininterrompu
+    window = int(SILENCE_MIN_SOUND_DURATION * INGEST_SAMPLE_RATE)
+    loud = np.abs(samples.astype(np.int32)).max(axis=1) > SILENCE_THRESHOLD * 32768
+    if len(loud) < window:
+        return 0
+    loud_counts = np.concatenate(([0], np.cumsum(loud)))
+    sound_starts = np.flatnonzero(loud_counts[window:] - loud_counts[:-window] == window)
+    return int(sound_starts[0]) if len(sound_starts) else len(samples)
+
+def analyze_samples(samples):
+    # Intensité intégrée avec le double seuil de l'EBU R128 (sans la pondération K), puis les
+    # fenêtres les plus énergiques comme points d'accroche, le tout en opérations sur blocs.
+    mono = samples.astype(np.float32).mean(axis=1) / 32768
+    block = int(LOUDNESS_BLOCK_DURATION * INGEST_SAMPLE_RATE)
+    block_count = len(mono) // block
+    if not block_count:
+        return {"loudness": None, "hooks": []}
+    powers = np.square(mono[:block_count*block].reshape(block_count, block)).mean(axis=1)
+    levels = 10 * np.log10(np.maximum(powers, 1e-12))
+
+    gated = powers[levels > LOUDNESS_ABSOLUTE_GATE]
+    if not len(gated):
+        return {"loudness": None, "hooks": []}
+    relative_gate = 10 * np.log10(gated.mean()) + LOUDNESS_RELATIVE_GATE
+    gated = powers[levels > max(LOUDNESS_ABSOLUTE_GATE, relative_gate)]
+    loudness = float(10 * np.log10(gated.mean()))
+
+    window = max(1, int(HOOK_WINDOW_DURATION / LOUDNESS_BLOCK_DURATION))
+    energy = np.convolve(powers, np.ones(window) / window, mode="same")
+    first, last = (int(bound * block_count) for bound in HOOK_RANGE)
+    hooks = []
+    for idx in first + np.argsort(energy[first:last])[::-1]:
+        second = float(idx * LOUDNESS_BLOCK_DURATION)
+        if all(abs(second - hook) >= HOOK_MIN_GAP for hook in hooks):
+            hooks.append(second)
+            if len(hooks) == HOOK_COUNT:
+                break
+    return {"loudness": round(loudness, 2), "hooks": sorted(round(hook, 1) for hook in hooks)}
+
+def encode_audio(samples, output_file, codec=DEFAULT_AUDIO_CODEC, bitrate=DEFAULT_AUDIO_BITRATE):
+    encoder, _ = AUDIO_CODECS[codec]
+    command = ["ffmpeg", "-v", "error", "-y",
+               "-f", "s16le",
+               "-ac", str(INGEST_CHANNELS),
+               "-ar", str(INGEST_SAMPLE_RATE),
+               "-i", "-",
+               "-c:a", encoder]
+    if codec != "flac":
+        command += ["-b:a", bitrate]
+    subprocess.run(command + [output_file], input=samples.tobytes(), check=True)
+
+def ingest_audio(track, input_file, work_dir, codec=DEFAULT_AUDIO_CODEC, bitrate=DEFAULT_AUDIO_BITRATE, timings=None):
+    # un seul décodage et un seul encodage, la suppression des silences se fait entre les deux
+    timings = timings if timings is not None else {}
+    _, extension = AUDIO_CODECS[codec]
+    output_file = os.path.join(work_dir, f"ingested.{extension}")
+
+    start = time()
+    samples = decode_audio(input_file)
+    timings["decode"] = time() - start
+
+    start = time()
+    samples = samples[leading_silence(samples):]
+    timings["trim"] = time() - start
+
+    start = time()
+    analysis = analyze_samples(samples)
+    timings["analyze"] = time() - start
+
+    start = time()
+    encode_audio(samples, output_file, codec, bitrate)
+    timings["encode"] = time() - start
+
+    print(f"[{track}] Silences supprimés, encodé en {codec}.")
+    return output_file, analysis
+
+class AnalysisIndex:
+    # Fichier annexe des analyses (intensité, points d'accroche), indexé par nom de piste.
+    def __init__(self, path=ANALYSIS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, track):
+        return self.entries.get(track, {})
+
+    def update(self, track, analysis):
+        with self._lock:
+            self.entries[track] = analysis
+            self._save()
+
+    def remove(self, tracks):
+        with self._lock:
+            for track in tracks:
+                self.entries.pop(track, None)
+            self._save()
+
+    def _save(self):
+        # appelé avec le verrou
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Stock des pistes
+##################
+
+class BlobStore:
+    # Fichiers audio rangés sous l'empreinte de leur contenu (store/blobs), et index qui relie noms de la playlist
+    # et identifiants de vidéo à ces fichiers. tracks/ ne contient que des liens symboliques vers les blobs :
+    # renommer une piste ou ajouter son video_id ne retélécharge rien, et un même son n'est gardé qu'une fois.
+    def __init__(self, directory=STORE_DIR):
+        self.blobs_dir = os.path.join(directory, "blobs")
+        self.index_file = os.path.join(directory, "index.json")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(TRACKS_DIR, exist_ok=True)
+        self._lock = threading.Lock()
+        try:
+            with open(self.index_file, "r") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        self.names = index.get("names", {}) # nom de piste -> blob
+        self.videos = index.get("videos", {}) # video_id -> blob
+
+    def _save(self):
+        # appelé avec le verrou
+        temp_path = f"{self.index_file}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"names": self.names, "videos": self.videos}, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.index_file)
+
+    def blob_for(self, track=None, video_id=None):
+        with self._lock:
+            blob = self.names.get(track) or self.videos.get(video_id)
+        if blob and os.path.isfile(os.path.join(self.blobs_dir, blob)):
+            return blob
+        return None
+
+    def names_for(self, blob):
+        with self._lock:
+            return [name for name, other in self.names.items() if other == blob]
+
+    def add(self, track, audio_file, video_id=None):
+        # déplace audio_file dans le stock, ou le supprime si un blob identique existe déjà
+        extension = audio_file.rsplit(".", 1)[1]
+        blob = f"{file_hash(audio_file)}.{extension}"
+        blob_path = os.path.join(self.blobs_dir, blob)
+        if os.path.isfile(blob_path):
+            os.remove(audio_file)
+        else:
+            shutil.move(audio_file, blob_path)
+        self.link(track, blob, video_id)
+        return blob
+
+    def link(self, track, blob, video_id=None):
+        with self._lock:
+            self.names[track] = blob
+            if video_id:
+                self.videos[video_id] = blob
+            self._save()
+        self._remove_track_files(track)
+        link_path = os.path.join(TRACKS_DIR, f"{track}.{blob.rsplit('.', 1)[1]}")
+        temp_path = f"{link_path}.tmp"
+        os.symlink(os.path.relpath(os.path.join(self.blobs_dir, blob), TRACKS_DIR), temp_path)
+        os.replace(temp_path, link_path)
+
+    def unlink(self, track):
+        with self._lock:
+            self.names.pop(track, None)
+            self._save()
+        self._remove_track_files(track)
+
+    def adopt(self, track, video_id=None):
+        # une piste de tracks/ : un fichier d'avant le stock y entre, un video_id nouveau est retenu
+        track_file = find_track_file(track)
+        if not os.path.islink(track_file):
+            return self.add(track, track_file, video_id)
+        with self._lock:
+            blob = self.names.get(track)
+            if blob and video_id and video_id not in self.videos:
+                self.videos[video_id] = blob
+                self._save()
+        return blob
+
+    def diff(self, entries):
+        # ce qui sépare la playlist [(nom, video_id)] du stock
+        changes = {"unchanged": [], "adopt": [], "relink": [], "new": [], "removed": []}
+        for track, video_id in entries:
+            track_file = find_track_file(track)
+            if os.path.isfile(track_file):
+                changes["unchanged" if os.path.islink(track_file) else "adopt"].append(track)
+            elif self.blob_for(track, video_id):
+                changes["relink"].append(track)
+            else:
+                changes["new"].append(track)
+        names = {track for track, _ in entries}
+        with self._lock:
+            stored = list(self.names)
+        changes["removed"] = [name for name in stored if name not in names]
+        return changes
+
+    def garbage_collect(self):
+        # supprime les blobs qu'aucun nom ne référence plus, et les video_id qui y menaient
+        with self._lock:
+            referenced = set(self.names.values())
+            removed, freed = 0, 0
+            for blob in os.listdir(self.blobs_dir):
+                if blob not in referenced:
+                    path = os.path.join(self.blobs_dir, blob)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+            self.videos = {video_id: blob for video_id, blob in self.videos.items() if blob in referenced}
+            self._save()
+        return removed, freed
+
+    @staticmethod
+    def _remove_track_files(track):
+        for _, extension in AUDIO_CODECS.values():
+            path = os.path.join(TRACKS_DIR, f"{track}.{extension}")
+            if os.path.lexists(path):
+                os.remove(path)
+
+# Index de la playlist
+######################
 
-    print("Son téléchargé.")
+class TrackIndex:
+    # Manifeste SQLite de la playlist : tout ce dont `play` a besoin sans relire ni décoder les fichiers.
+    # Une ligne n'est recalculée que si la date de modification de sa piste ou de sa pochette a changé.
+    COLUMNS = ("position", "name", "artist", "title", "audio_file", "cover_file", "audio_mtime", "cover_mtime",
+               "audio_hash", "duration", "cover_width", "cover_height", "loudness", "hooks")
+
+    def __init__(self, path=INDEX_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tracks (position INTEGER PRIMARY KEY, name TEXT, artist TEXT, "
+                        "title TEXT, audio_file TEXT, cover_file TEXT, audio_mtime REAL, cover_mtime REAL, "
+                        "audio_hash TEXT, duration REAL, cover_width INTEGER, cover_height INTEGER, "
+                        "loudness REAL, hooks TEXT)")
+
+    def is_current(self, playlist_file):
+        meta = dict(self.db.execute("SELECT key, value FROM meta"))
+        return (meta.get("playlist_file") == os.path.abspath(playlist_file) and
+                meta.get("playlist_mtime") == str(os.stat(playlist_file).st_mtime))
+
+    def rows(self):
+        cursor = self.db.execute(f"SELECT {', '.join(self.COLUMNS)} FROM tracks ORDER BY position")
+        return [dict(zip(self.COLUMNS, values)) for values in cursor]
+
+    def build(self, playlist_file, analysis_index):
+        with open(playlist_file, "r") as f:
+            names = [parse_playlist_line(line)[0] for line in f.read().splitlines() if line.strip()]
+        known = {row["name"]: row for row in self.rows()}
+        rows = []
+        for position, name in enumerate(names):
+            artist, title = split_track_name(name)
+            row = dict(known.get(name, {}), position=position, name=name, artist=artist, title=title,
+                       audio_file=find_track_file(name), cover_file=os.path.join(COVERS_DIR, f"{name}.jpg"))
+            rows.append(self._refresh(row, analysis_index))
+        with self.db:
+            self.db.execute("DELETE FROM tracks")
+            self.db.executemany(f"INSERT INTO tracks ({', '.join(self.COLUMNS)}) "
+                                f"VALUES ({', '.join('?' * len(self.COLUMNS))})",
+                                [tuple(row.get(column) for column in self.COLUMNS) for row in rows])
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('playlist_file', ?)", (os.path.abspath(playlist_file),))
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('playlist_mtime', ?)", (str(os.stat(playlist_file).st_mtime),))
+        return rows
+
+    def validate(self, analysis_index):
+        # ne relit que les fichiers modifiés depuis la construction ; renvoie les lignes et les fichiers manquants
+        rows, missing = [], []
+        for row in self.rows():
+            refreshed = dict(row)
+            if (audio_file := find_track_file(row["name"])) != row["audio_file"]: # codec ou extension changés
+                refreshed.update(audio_file=audio_file, audio_mtime=None)
+            row_missing = [refreshed[column] for column in ("audio_file", "cover_file")
+                           if not os.path.isfile(refreshed[column])]
+            missing += row_missing
+            if not row_missing:
+                refreshed = self._refresh(refreshed, analysis_index)
+                if refreshed != row:
+                    with self.db:
+                        self.db.execute(f"UPDATE tracks SET {', '.join(f'{column} = ?' for column in self.COLUMNS)} "
+                                        f"WHERE position = ?",
+                                        tuple(refreshed[column] for column in self.COLUMNS) + (row["position"],))
+                row = refreshed
+            rows.append(row)
+        return rows, missing
+
+    def _refresh(self, row, analysis_index):
+        if os.path.isfile(row["audio_file"]):
+            mtime = os.stat(row["audio_file"]).st_mtime
+            if mtime != row.get("audio_mtime"):
+                source = pg.media.load(row["audio_file"], streaming=True)
+                row.update(audio_mtime=mtime, audio_hash=file_hash(row["audio_file"]), duration=source.duration)
+                source.delete()
+        if os.path.isfile(row["cover_file"]):
+            mtime = os.stat(row["cover_file"]).st_mtime
+            if mtime != row.get("cover_mtime"):
+                image = pg.image.load(row["cover_file"])
+                row.update(cover_mtime=mtime, cover_width=image.width, cover_height=image.height)
+        analysis = analysis_index.get(row["name"])
+        row.update(loudness=analysis.get("loudness"), hooks=json.dumps(analysis.get("hooks", [])))
+        return row
+
+# Cache PCM
+###########
+
+class FadingSource(pg.media.Source):
+    # Enveloppe la source d'un lecteur : le fondu de fin est une rampe de gain appliquée échantillon
+    # par échantillon dans le thread audio, indépendante de la fréquence des images. La rampe est placée
+    # sur la ligne de temps de la piste, à partir de l'instant en cours de lecture : le décodage a de l'avance
+    # sur la carte son, et les données déjà envoyées sont jouées à plein volume avant de rejoindre la courbe.
+    def __init__(self, source):
+        self.source = source
+        self.audio_format = source.audio_format
+        self._duration = source.duration
+        self._fade_rate = None
+        self._fade_start = None
+        self._fade_length = None
+
+    def fade_out(self, factor, start):
+        # même courbe que l'ancien fondu : volume multiplié par `factor` tous les FADE_OUT_STEP ;
+        # start est la position de lecture (Player.time), en secondes de la piste
+        factor = min(factor, 0.999)
+        if factor <= 0:
+            duration = 0
+            fade_rate = 0
+        else:
+            duration = FADE_OUT_STEP * np.log(FADE_OUT_FLOOR) / np.log(factor)
+            fade_rate = np.log(factor) / (FADE_OUT_STEP * self.audio_format.sample_rate)
+        self._fade_rate = fade_rate
+        self._fade_start = int(start * self.audio_format.sample_rate)
+        self._fade_length = int(duration * self.audio_format.sample_rate) # en dernier, pour le thread audio
+        return duration
+
+    def seek(self, timestamp):
+        self.source.seek(timestamp)
+
+    def get_audio_data(self, num_bytes, compensation_time=0.0):
+        fade_length = self._fade_length
+        audio_data = self.source.get_audio_data(num_bytes, compensation_time)
+        if audio_data is None or fade_length is None:
+            return audio_data
+
+        # position du premier échantillon par rapport au début du fondu, d'après l'horodatage des données
+        first = int(round(audio_data.timestamp * self.audio_format.sample_rate)) - self._fade_start
+        if first >= fade_length:
+            return None
+        dtype = np.int16 if self.audio_format.sample_size == 16 else np.uint8
+        samples = np.frombuffer(audio_data.get_string_data(), dtype=dtype).reshape(-1, self.audio_format.channels)
+        samples = samples[:fade_length - first]
+        positions = np.maximum(np.arange(first, first + len(samples)), 0)
+        gains = np.exp(positions * self._fade_rate)[:, None]
+        if dtype == np.int16:
+            samples = (samples * gains).astype(np.int16)
+        else:
+            samples = ((samples.astype(np.float32) - 128) * gains + 128).astype(np.uint8)
 
-    subprocess.run(["sox", 
-                    "temp_audio.mp3",
-                    output_file,
-                    "silence",
-                    "1",
-                    "0.1",
-                    "0.1%"])
+        data = samples.tobytes()
+        duration = len(samples) / self.audio_format.sample_rate
+        return pg.media.codecs.AudioData(data, len(data), audio_data.timestamp, duration, audio_data.events)
 
-    print("Silences supprimés.")
+class AnswerTimer:
+    # Le temps restant est calculé à la lecture, à partir de l'instant de départ
+    def __init__(self):
+        self.started_at = None
+        self.duration = None
 
-    os.remove("temp_audio.mp3")
+    def start(self, duration):
+        self.started_at = monotonic()
+        self.duration = duration
 
-def download_cover(track):
-    temp_cover_file = "temp_cover.jpg"
+    def reset(self):
+        self.started_at = None
 
-    cp = coverpy.CoverPy()
-    try:
-        cover = cp.get_cover(track)
-        cover_url = cover.artwork(800)
-        response = requests.get(cover_url)
-        if response.status_code == 200:
-            with open(temp_cover_file, "wb") as f:
-                f.write(response.content)
+    @property
+    def fraction(self):
+        if self.started_at is None:
+            return 1
+        return max(0, 1 - (monotonic() - self.started_at) / self.duration)
 
-        os.rename(temp_cover_file, os.path.join(COVERS_DIR, f"{track}.jpg"))
-        print("Couverture téléchargée.")
-    except coverpy.exceptions.NoResultsException:
-        os.symlink(os.path.join(BASE_DIR, IMAGES_DIR, NOCOVER_IMAGE), os.path.join(COVERS_DIR, f"{track}.jpg"))
-        print("Couverture introuvable, lien symbolique créé vers couverture générique.")
+    @property
+    def running(self):
+        return self.started_at is not None and self.fraction > 0
+
+class MappedSource(pg.media.Source):
+    # Piste déjà décodée, lue directement depuis un fichier projeté en mémoire :
+    # ni décodage, ni copie complète en RAM, un seek ne coûte que des défauts de page.
+    # Comme une StaticSource, elle peut être mise en file plusieurs fois : chaque lecture a sa propre source.
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, channels, sample_size, sample_rate = PCM_HEADER.unpack_from(self._mmap)
+        if magic != PCM_MAGIC:
+            raise ValueError(f"{path} n'est pas un fichier PCM du cache")
+        self.audio_format = pg.media.codecs.AudioFormat(channels, sample_size, sample_rate)
+        self._data = memoryview(self._mmap)[PCM_HEADER.size:]
+        self._duration = len(self._data) / self.audio_format.bytes_per_second
+
+    def get_queue_source(self):
+        return MappedQueueSource(self._data, self.audio_format)
+
+class MappedQueueSource(pg.media.Source):
+    def __init__(self, data, audio_format):
+        self._data = data
+        self._offset = 0
+        self.audio_format = audio_format
+        self._duration = len(data) / audio_format.bytes_per_second
+
+    def seek(self, timestamp):
+        offset = int(timestamp * self.audio_format.bytes_per_second)
+        offset -= offset % self.audio_format.bytes_per_sample
+        self._offset = min(max(offset, 0), len(self._data))
+
+    def get_audio_data(self, num_bytes, compensation_time=0.0):
+        num_bytes -= num_bytes % self.audio_format.bytes_per_sample
+        data = bytes(self._data[self._offset:self._offset+num_bytes])
+        if not data:
+            return None
+        timestamp = self._offset / self.audio_format.bytes_per_second
+        duration = len(data) / self.audio_format.bytes_per_second
+        self._offset += len(data)
+        return pg.media.codecs.AudioData(data, len(data), timestamp, duration, [])
+
+class PCMCache:
+    # Cache disque des pistes décodées, indexé par l'empreinte du fichier audio.
+    def __init__(self, directory=PCM_CACHE_DIR, cap_bytes=DEFAULT_PCM_CACHE_MB * 1024 * 1024):
+        self.directory = directory
+        self.cap_bytes = cap_bytes
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, audio_file, audio_hash=None):
+        if not audio_hash:
+            stat = os.stat(audio_file)
+            key = (audio_file, stat.st_size, stat.st_mtime)
+            if key not in self._hashes:
+                self._hashes[key] = file_hash(audio_file)
+            audio_hash = self._hashes[key]
+        return os.path.join(self.directory, f"{audio_hash}.pcm")
+
+    def entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".pcm"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def load(self, audio_file, audio_hash=None):
+        path = self.path_for(audio_file, audio_hash)
+        if os.path.isfile(path):
+            os.utime(path) # la date de modification sert d'ordre LRU
+        else:
+            self._write(audio_file, path)
+            self.trim(keep=path)
+        return MappedSource(path)
+
+    def trim(self, keep=None):
+        with self._lock:
+            entries = self.entries()
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.cap_bytes:
+                    break
+                if path == keep:
+                    continue
+                os.remove(path)
+                total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            os.remove(path)
+
+    def _write(self, audio_file, path):
+        os.makedirs(self.directory, exist_ok=True)
+        source = pg.media.load(audio_file, streaming=True)
+        audio_format = source.audio_format
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(PCM_HEADER.pack(PCM_MAGIC, audio_format.channels, audio_format.sample_size, audio_format.sample_rate))
+            while audio_data := source.get_audio_data(1 << 20):
+                f.write(audio_data.get_string_data())
+        source.delete()
+        os.replace(temp_path, path) # atomique : un autre lecteur ne voit jamais un fichier à moitié écrit
 
 # Classes de fenêtres
 #####################
 
-class ButtonCheckWindow(pg.window.Window):
+class FrameTimer:
+    # Durées des derniers on_draw d'une fenêtre
+    def __init__(self, name, size=600):
+        self.name = name
+        self.durations = deque(maxlen=size)
+        self.count = 0
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.durations.append(perf_counter() - self._start)
+        self.count += 1
+
+    def report(self):
+        if not self.durations:
+            return f"{self.name} : aucune image"
+        durations = sorted(self.durations)
+        mean = sum(durations) / len(durations)
+        p95 = durations[int(0.95 * (len(durations) - 1))]
+        return (f"{self.name} : {len(durations)} images, moyenne {1000*mean:.2f} ms, "
+                f"p95 {1000*p95:.2f} ms, max {1000*durations[-1]:.2f} ms")
+
+class LineStack:
+    # Une étiquette HTML par ligne : seules les lignes dont le texte change sont remises en page.
+    def __init__(self, x, y, anchor_y, batch, template):
+        self.x = x
+        self.y = y
+        self.anchor_y = anchor_y # "top" : les lignes descendent depuis y, "bottom" : elles montent
+        self.batch = batch
+        self.template = template
+        self.labels = []
+        self.texts = []
+        self.line_height = pg.text.HTMLLabel(template.format("Ag"), multiline=True, width=9999).content_height
+
+    def set_lines(self, lines):
+        resized = len(lines) != len(self.labels)
+        while len(self.labels) < len(lines):
+            self.labels.append(pg.text.HTMLLabel("",
+                                                 anchor_x="left",
+                                                 anchor_y=self.anchor_y,
+                                                 x=self.x,
+                                                 multiline=True,
+                                                 width=9999,
+                                                 batch=self.batch))
+            self.texts.append(None)
+        while len(self.labels) > len(lines):
+            self.labels.pop().delete()
+            self.texts.pop()
+
+        for idx, (label, line) in enumerate(zip(self.labels, lines)):
+            if self.texts[idx] != line:
+                label.text = self.template.format(line)
+                self.texts[idx] = line
+            if resized:
+                if self.anchor_y == "top":
+                    label.y = self.y - idx*self.line_height
+                else:
+                    label.y = self.y + (len(lines)-1-idx)*self.line_height
+
+class RedrawEventLoop(pg.app.EventLoop):
+    # Boucle qui ne redessine une fenêtre que si elle a été invalidée, ou tant qu'elle anime quelque chose.
+    # Plusieurs invalidations entre deux passages ne donnent qu'un seul dessin, synchronisé sur l'écran.
     def __init__(self):
+        super(RedrawEventLoop, self).__init__()
+        self.publishers = [] # sorties hors fenêtre (afficheurs séparés), publiées comme on redessinerait
+
+    def invalidate(self, *windows):
+        for window in windows or pg.app.windows:
+            window.needs_redraw = True
+
+    def idle(self):
+        dt = self.clock.update_time()
+        self.clock.call_scheduled_functions(dt)
+
+        for publisher in self.publishers:
+            if publisher.needs_redraw:
+                publisher.needs_redraw = False
+                publisher.publish()
+
+        animating = False
+        for window in pg.app.windows:
+            window_animating = getattr(window, "is_animating", lambda: False)()
+            animating = animating or window_animating
+            if getattr(window, "needs_redraw", True) or window_animating:
+                window.needs_redraw = False
+                window.switch_to()
+                window.dispatch_event("on_draw")
+                window.flip()
+
+        sleep_time = self.clock.get_sleep_time(True)
+        if animating:
+            return ANIMATION_FRAME_INTERVAL if sleep_time is None else min(sleep_time, ANIMATION_FRAME_INTERVAL)
+        return sleep_time
+
+class LatencyProbe:
+    # Suit chaque appui de bout en bout : appui (horodatage du noyau avec evdev), arrivée dans le jeu,
+    # début du on_draw qui l'affiche, puis fin du flip qui envoie l'image à l'écran.
+    def __init__(self, history=LATENCY_HISTORY):
+        self.history = history
+        self.waiting = [] # appuis arrivés, pas encore dessinés
+        self.drawing = [] # appuis dessinés, en attente du flip
+        self.samples = {} # (boîtier, bouton) -> deque de (arrivée, dessin, flip) en secondes depuis l'appui
+        self.rows = []
+
+    def arrived(self, device, button, pressed_at):
+        self.waiting.append((device, button, pressed_at, time()))
+
+    def drawn(self):
+        now = time()
+        self.drawing.extend(event + (now,) for event in self.waiting)
+        self.waiting = []
+
+    def flipped(self):
+        now = time()
+        for device, button, pressed_at, arrived_at, drawn_at in self.drawing:
+            samples = self.samples.setdefault((device, button), deque(maxlen=self.history))
+            samples.append((arrived_at - pressed_at, drawn_at - pressed_at, now - pressed_at))
+            self.rows.append((device, button, pressed_at, arrived_at, drawn_at, now))
+        self.drawing = []
+
+    def report(self):
+        if not self.samples:
+            return ["Latence : aucun appui mesuré"]
+        lines = []
+        for (device, button), samples in sorted(self.samples.items()):
+            columns = []
+            for stage, values in zip(("arrivée", "dessin", "flip"), zip(*samples)):
+                values = sorted(values)
+                p50, p95, p99 = (1000*values[int(q * (len(values) - 1))] for q in (0.5, 0.95, 0.99))
+                columns.append(f"{stage} {p50:.1f}/{p95:.1f}/{p99:.1f}")
+            lines.append(f"Boîtier {device} bouton {button} ({len(samples)} appuis, ms p50/p95/p99) : "
+                         + ", ".join(columns))
+        return lines
+
+    def export(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["device", "button", "pressed_at", "arrived_at", "drawn_at", "flipped_at",
+                             "arrival_ms", "draw_ms", "flip_ms"])
+            for device, button, pressed_at, arrived_at, drawn_at, flipped_at in self.rows:
+                writer.writerow([device, button, f"{pressed_at:.6f}", f"{arrived_at:.6f}", f"{drawn_at:.6f}",
+                                 f"{flipped_at:.6f}", f"{1000*(arrived_at - pressed_at):.3f}",
+                                 f"{1000*(drawn_at - pressed_at):.3f}", f"{1000*(flipped_at - pressed_at):.3f}"])
+
+def summarize_durations(durations):
+    # durées en secondes -> résumé en millisecondes
+    if not durations:
+        return {"count": 0}
+    durations = sorted(durations)
+    return {"count": len(durations),
+            "p50": round(1000*durations[len(durations)//2], 3),
+            "p95": round(1000*durations[int(0.95*(len(durations)-1))], 3),
+            "max": round(1000*durations[-1], 3)}
+
+def resident_memory():
+    # mémoire résidente du processus, en octets (Linux uniquement)
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def prometheus_labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+class Metrics:
+    # Mesures de la partie en cours. Pendant le jeu, on ne fait qu'ajouter des durées à des deques bornées ;
+    # les résumés ne sont calculés que pour l'affichage (touche M) ou l'écriture du fichier de mesures.
+    def __init__(self, history=METRICS_HISTORY):
+        self.buzz_handling = deque(maxlen=history) # traitement de l'appui par le jeu
+        self.buzz_latencies = deque(maxlen=history) # de l'appui à son traitement
+        self.started = time()
+
+    def record_buzz(self, timestamp, duration):
+        self.buzz_handling.append(duration)
+        self.buzz_latencies.append(time() - timestamp)
+
+    def snapshot(self):
+        windows = [window for window in (getattr(state, "control_window", None), getattr(state, "display_window", None))
+                   if window]
+        clock = pg.clock.get_default()
+        return {"time": round(time(), 3),
+                "uptime": round(time() - self.started, 1),
+                "frames": {window.frame_timer.name: {"drawn": window.frame_timer.count,
+                                                     **summarize_durations(window.frame_timer.durations)}
+                           for window in windows},
+                "buzz_handling": summarize_durations(self.buzz_handling),
+                "buzz_latency": summarize_durations(self.buzz_latencies),
+                "track_load": summarize_durations(state.track_store.load_times),
+                "track_stall": summarize_durations(state.track_store.stall_times),
+                "audio_resident_bytes": state.track_store.resident_bytes,
+                "scheduled": {"every_tick": len(getattr(clock, "_schedule_items", ())),
+                              "interval": len(getattr(clock, "_schedule_interval_items", ()))},
+                "rss_bytes": resident_memory()}
+
+    def lines(self):
+        snapshot = self.snapshot()
+        def summary(values):
+            if not values["count"]:
+                return "-"
+            return f"{values['p50']:.1f}/{values['p95']:.1f}/{values['max']:.1f} ms ({values['count']})"
+        lines = ["Mesures (p50/p95/max)", ""]
+        for name, frames in snapshot["frames"].items():
+            lines.append(f"Image {name} : {summary(frames)}")
+        lines.append(f"Buzz, traitement : {summary(snapshot['buzz_handling'])}")
+        lines.append(f"Buzz, depuis l'appui : {summary(snapshot['buzz_latency'])}")
+        lines.append(f"Chargement piste : {summary(snapshot['track_load'])}")
+        lines.append(f"Attente piste : {summary(snapshot['track_stall'])}")
+        lines.append(f"Audio en mémoire : {snapshot['audio_resident_bytes'] / 1024**2:.0f} Mo")
+        lines.append(f"Planifiées : {snapshot['scheduled']['every_tick']} à chaque tour, "
+                     f"{snapshot['scheduled']['interval']} à intervalle")
+        if snapshot["rss_bytes"] is not None:
+            lines.append(f"Mémoire résidente : {snapshot['rss_bytes'] / 1024**2:.0f} Mo")
+        return lines
+
+    def write(self, path):
+        # .prom : format texte de Prometheus, réécrit à chaque fois ; sinon une ligne JSON ajoutée au fichier
+        snapshot = self.snapshot()
+        if not path.endswith(".prom"):
+            with open(path, "a") as f:
+                f.write(json.dumps(snapshot) + "\n")
+            return
+        lines = [f"blind_uptime_seconds {snapshot['uptime']}",
+                 f"blind_audio_resident_bytes {snapshot['audio_resident_bytes']}"]
+        if snapshot["rss_bytes"] is not None:
+            lines.append(f"blind_resident_memory_bytes {snapshot['rss_bytes']}")
+        for kind, count in snapshot["scheduled"].items():
+            lines.append(f"blind_scheduled_functions{prometheus_labels({'kind': kind})} {count}")
+        series = [("blind_frame_time_ms", {"window": name}, frames) for name, frames in snapshot["frames"].items()]
+        series += [(f"blind_{name}_ms", {}, snapshot[name])
+                   for name in ("buzz_handling", "buzz_latency", "track_load", "track_stall")]
+        for metric, labels, values in series:
+            for stat in ("p50", "p95", "max"):
+                if stat in values:
+                    lines.append(f"{metric}{prometheus_labels(labels, stat=stat)} {values[stat]}")
+            lines.append(f"{metric}_count{prometheus_labels(labels)} {values['count']}")
+        for name, frames in snapshot["frames"].items():
+            lines.append(f"blind_frames_drawn_total{prometheus_labels({'window': name})} {frames['drawn']}")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, path)
+
+class ButtonCheckWindow(pg.window.Window):
+    def __init__(self, latency_probe=None):
         super(ButtonCheckWindow, self).__init__(400, 100, caption="Blind - Test des boutons")
 
+        self.latency_probe = latency_probe
+        self.needs_redraw = True
+
         self.button_labels = []
         for i in range(10):
             self.button_labels.append(pg.text.Label(str(i),
@@ -141,31 +1033,45 @@ class ButtonCheckWindow(pg.window.Window):
                                                     anchor_y="center"))
 
     def on_draw(self):
+        if self.latency_probe:
+            self.latency_probe.drawn()
         self.clear()
         for button_label in self.button_labels:
             button_label.draw()
 
+    def flip(self):
+        super(ButtonCheckWindow, self).flip()
+        if self.latency_probe:
+            self.latency_probe.flipped()
+
+    def on_activate(self):
+        self.needs_redraw = True
+
+    def on_expose(self):
+        self.needs_redraw = True
+
 class ControlWindow(pg.window.Window):
     def __init__(self):
         super(ControlWindow, self).__init__(CONTROL_WINDOW_WIDTH,
                                             CONTROL_WINDOW_HEIGHT,
                                             caption="Blind - Contrôleur")
 
-        self.playlist_label = pg.text.HTMLLabel("Playlist",
-                                            anchor_x="left",
-                                            anchor_y="top",
-                                            x=CONTROL_WINDOW_PADDING,
-                                            y=CONTROL_WINDOW_HEIGHT-2*CONTROL_WINDOW_PADDING-TIMER_OUTLINE_HEIGHT,
-                                            multiline=True,
-                                            width=9999)
-
-        self.info_label = pg.text.HTMLLabel("Info",
-                                         anchor_x="left",
-                                         anchor_y="bottom",
-                                         x=CONTROL_WINDOW_PADDING,
-                                         y=CONTROL_WINDOW_PADDING,
-                                         multiline=True,
-                                         width=9999)
+        self.frame_timer = FrameTimer("Contrôleur")
+        self.needs_redraw = True
+        self.shown_position = None
+        self.labels_batch = pg.graphics.Batch()
+
+        self.playlist_lines = LineStack(CONTROL_WINDOW_PADDING,
+                                        CONTROL_WINDOW_HEIGHT-2*CONTROL_WINDOW_PADDING-TIMER_OUTLINE_HEIGHT,
+                                        "top",
+                                        self.labels_batch,
+                                        f"<pre><font face='{CONTROL_WINDOW_FONT}'>{{}}</font></pre>")
+
+        self.info_lines = LineStack(CONTROL_WINDOW_PADDING,
+                                    CONTROL_WINDOW_PADDING,
+                                    "bottom",
+                                    self.labels_batch,
+                                    f"<pre><font color='{COLOR_WHITE}' face='{CONTROL_WINDOW_FONT}'>{{}}</font></pre>")
 
         self.timer_outline = pg.shapes.Rectangle(CONTROL_WINDOW_PADDING,
                                                  CONTROL_WINDOW_HEIGHT-TIMER_OUTLINE_HEIGHT-CONTROL_WINDOW_PADDING,
@@ -182,12 +1088,29 @@ class ControlWindow(pg.window.Window):
                                              TIMER_BAR_WIDTH,
                                              TIMER_BAR_HEIGHT,
                                              color=(255, 255, 255))
-        self.success_fx = pg.media.load(os.path.join(FX_DIR, SUCCESS_FX), streaming=False)
+        pg.clock.schedule_interval_soft(self.check_position, POSITION_CHECK_INTERVAL)
+
+    def is_animating(self):
+        return state.timer_running
+
+    def check_position(self, dt):
+        # la position de lecture n'est affichée qu'à la seconde près : inutile de redessiner plus souvent
+        position = int(state.player.time) if state.player else None
+        if position != self.shown_position:
+            self.shown_position = position
+            self.needs_redraw = True
+
+    def refresh_metrics(self, dt):
+        self.needs_redraw = True
 
     def on_draw(self):
+        with self.frame_timer:
+            self.draw()
+
+    def draw(self):
         self.clear()
 
-        playlist_label_string = ""
+        playlist_lines = []
 
         bottom_track = MAX_PLAYLIST_ENTRIES-1+state.playlist_scroll
         top_track = state.playlist_scroll
@@ -230,16 +1153,17 @@ class ControlWindow(pg.window.Window):
                 else:
                     line = "\u2026"+line[-38:]
             line = f"[{mark_artist}][{mark_title}] {line}"
-            line = f"<font color='{color}'>{line}</font>"
-            playlist_label_string += f"{line}<br>"
+            playlist_lines.append(f"<font color='{color}'>{line}</font>")
 
-        self.playlist_label.text = f"<font face='{CONTROL_WINDOW_FONT}'>{playlist_label_string}</font>"
+        if state.metrics_visible:
+            playlist_lines = [f"<font color='{COLOR_WHITE}'>{line}</font>" for line in state.metrics.lines()]
+        self.playlist_lines.set_lines(playlist_lines)
 
-        info_label_string = ""
+        info_lines = []
 
-        info_label_string += f"{state.selected_track.artist}\n"
-        info_label_string += f"{state.selected_track.title}\n"
-        info_label_string += "\n"
+        info_lines.append(state.selected_track.artist)
+        info_lines.append(state.selected_track.title)
+        info_lines.append("")
 
         max_name_length = max(len(f"{team.name} ({team.number})") for team in state.teams)
         for team in state.teams:
@@ -248,69 +1172,65 @@ class ControlWindow(pg.window.Window):
             else:
                 color = COLOR_RED
             name_length = len(f"{team.name} ({team.number})")
-            info_label_string += f"<font color='{color}'>{team.name} ({team.number}){' '*(max_name_length-name_length)} : {team.score}</font><br>"
+            info_lines.append(f"<font color='{color}'>{team.name} ({team.number}){' '*(max_name_length-name_length)} : {team.score}</font>")
 
-        info_label_string += "<br>"
+        info_lines.append("")
 
-        info_label_string += f"Piste : {state.track_number+1}/{len(state.tracks)}<br>"
-        info_label_string += f"Pitch : {state.pitch}<br>"
+        info_lines.append(f"Piste : {state.track_number+1}/{len(state.tracks)}")
+        info_lines.append(f"Pitch : {state.pitch}")
         if state.player:
             elapsed_seconds = int(state.player.time)
             elapsed_minsec = f"{(elapsed_seconds // 60):02}:{(elapsed_seconds % 60):02}"
             total_seconds = int(state.selected_track.media.duration)
             total_minsec = f"{(total_seconds // 60):02}:{(total_seconds % 60):02}"
-            info_label_string += f"Position : {elapsed_minsec:} / {total_minsec}<br>"
+            info_lines.append(f"Position : {elapsed_minsec:} / {total_minsec}")
         else:
-            info_label_string += "Position : - / -<br>"
+            info_lines.append("Position : - / -")
 
         if state.gifs:
-            info_label_string += f"GIF : {state.gifs[0]['name']} ({'visible' if state.gif_visible else 'caché'})<br>"
+            info_lines.append(f"GIF : {state.gifs[0]} ({'visible' if state.gif_visible else 'caché'})")
         else:
-            info_label_string += "GIF : aucun<br>"
+            info_lines.append("GIF : aucun")
+
+        step_line = (f"<font color='{COLOR_YELLOW}'>Prêt</font>",
+                     f"<font color='{COLOR_GREEN}'>Lecture</font>",
+                     f"<font color='{COLOR_RED}'>Réponse</font>")[state.step]
 
-        info_label_string += (f"<font color='{COLOR_YELLOW}'>Prêt</font>",
-                              f"<font color='{COLOR_GREEN}'>Lecture</font>",
-                              f"<font color='{COLOR_RED}'>Réponse</font>")[state.step]
-        
         if state.step == STEP_ANSWERING:
-            info_label_string += f" ({state.last_team_to_buzz.name})"
-            # aucun rapport avec le label d'infos :
-            if not state.timer_running: # pour éviter que le schedule_interval crée plusieurs intervalles.
-                                        # Note : pas possible de se baser sur timer, car il est réduit dans
-                                        # le callback, or le callback n'est pas appelé à t=0, mais à t=0.01,
-                                        # donc dans l'intervalle on_draw() peut s'exécuter plusieurs fois.
-                state.timer_running = True
-                pg.clock.schedule_interval(state.reduce_answer_timer, 0.01)
+            step_line += f" ({state.last_team_to_buzz.name})"
 
-        self.info_label.text = f"<pre><font color='{COLOR_WHITE}' face='{CONTROL_WINDOW_FONT}'>{info_label_string}</font></pre>"
+        info_lines.append(step_line)
+        self.info_lines.set_lines(info_lines)
 
         self.timer_bar.width = state.timer * TIMER_BAR_WIDTH
 
-        if state.selected_track.title_revealed and state.selected_track.artist_revealed and state.step == STEP_ANSWERING:
-            state.step = STEP_PLAYING
-            state.toggle_pause()
-
-        self.playlist_label.draw()
-        self.info_label.draw()
+        self.labels_batch.draw()
         self.timer_outline.draw()
         self.timer_gap.draw()
         self.timer_bar.draw()
 
     def on_activate(self):
-        self.dispatch_event("on_draw")
+        self.needs_redraw = True
 
     def on_expose(self):
-        self.dispatch_event("on_draw")
+        self.needs_redraw = True
 
     def on_key_press(self, symbol, modifiers):
         if symbol == pg.window.key.ENTER:
             if not state.player:
                 state.step = STEP_PLAYING
-                state.player = state.selected_track.media.play()
+                state.fader = FadingSource(state.selected_track.media.get_queue_source())
+                state.player = pg.media.Player()
+                state.player.queue(state.fader)
+                state.player.play()
                 state.player.pitch = float(state.pitch)
+                state.player.volume = state.selected_track.gain
                 if modifiers & pg.window.key.MOD_CTRL: # ctrl appuyé : seek au hasard dans la piste
-                    random_point = random.uniform(0.2, 0.8) # ni trop au début, ni trop à la fin
-                    random_second = state.selected_track.media.duration * random_point
+                    if state.selected_track.hooks: # points d'accroche précalculés par `analyze`
+                        random_second = random.choice(state.selected_track.hooks)
+                    else:
+                        random_point = random.uniform(0.2, 0.8) # ni trop au début, ni trop à la fin
+                        random_second = state.selected_track.media.duration * random_point
                     state.player.seek(random_second)
 
             elif state.step == STEP_PLAYING:
@@ -324,27 +1244,38 @@ class ControlWindow(pg.window.Window):
         elif symbol == pg.window.key.R:
             state.selected_track.artist_revealed = True
             state.selected_track.title_revealed = True
-            state.display_window.dispatch_event("on_draw")
+            state.resume_if_revealed()
         elif symbol == pg.window.key.T and state.step == STEP_ANSWERING and not state.selected_track.title_revealed:
             state.last_team_to_buzz.score += 1
             state.selected_track.title_revealed = True
             state.selected_track.title_found_by = state.last_team_to_buzz
-            self.success_fx.play()
+            state.sound_effects.play("success")
+            state.resume_if_revealed()
         elif symbol == pg.window.key.A and state.step == STEP_ANSWERING and not state.selected_track.artist_revealed:
             state.last_team_to_buzz.score += 1
             state.selected_track.artist_revealed = True
             state.selected_track.artist_found_by = state.last_team_to_buzz
-            self.success_fx.play()
+            state.sound_effects.play("success")
+            state.resume_if_revealed()
         elif symbol == pg.window.key.L:
             state.leaderboard_visible = not state.leaderboard_visible
-            state.display_window.dispatch_event("on_draw")
+        elif symbol == pg.window.key.M:
+            state.metrics_visible = not state.metrics_visible
+            if state.metrics_visible: # rafraîchi tant qu'il est affiché, sans rien coûter une fois caché
+                pg.clock.schedule_interval_soft(self.refresh_metrics, METRICS_OVERLAY_INTERVAL)
+            else:
+                pg.clock.unschedule(self.refresh_metrics)
         elif symbol == pg.window.key.S:
             output = ""
             for team in state.teams:
-                output += f"{team.name}:{team.button_id}:{team.score}\n"
+                button = f"{team.button_id}@{team.device}" if team.device != 1 else str(team.button_id)
+                output += f"{team.name}:{button}:{team.score}\n"
             filename = f"teams_{int(time())}.txt"
             with open(filename, "w") as f:
                 f.write(output)
+        elif symbol == pg.window.key.F5:
+            if state.reloader:
+                state.reloader.reload()
         elif symbol == pg.window.key.G:
             if modifiers & pg.window.key.MOD_CTRL:
                 state.shift_selected_gif(1)
@@ -355,14 +1286,11 @@ class ControlWindow(pg.window.Window):
 
         elif symbol in NUMBER_KEYS:
             number = NUMBER_KEYS.index(symbol) + 1
-            try:
-                team = state.get_team_by_number(number)
+            if team := state.get_team_by_number(number):
                 if modifiers & pg.window.key.MOD_CTRL:
                     team.score -= 1
                 else:
                     team.score += 1
-            except StopIteration:
-                pass
 
     def on_text(self, text):
         if text == ".":
@@ -389,18 +1317,202 @@ class ControlWindow(pg.window.Window):
     def on_close(self):
         sys.exit()
 
+def display_snapshot():
+    # Tout ce que montre l'afficheur, en types simples : comparable d'une image à l'autre, et sérialisable
+    # pour un afficheur séparé. Artiste et titre n'y figurent qu'une fois révélés.
+    track = state.selected_track
+    return {"layout": {"step": state.step,
+                       "track_number": state.track_number,
+                       "artist": track.artist if track.artist_revealed else None,
+                       "title": track.title if track.title_revealed else None,
+                       "artist_found_by": track.artist_found_by.name if track.artist_found_by else None,
+                       "title_found_by": track.title_found_by.name if track.title_found_by else None,
+                       "cover_file": track.cover_file if track.artist_revealed and track.title_revealed else None,
+                       "answering_team": state.last_team_to_buzz.name if state.step == STEP_ANSWERING else None,
+                       "leaderboard": ([[team.name, team.score] for team in state.teams]
+                                       if state.leaderboard_visible else None),
+                       "gif": state.gifs[0] if state.gifs else None,
+                       "gif_visible": state.gif_visible},
+            "timer": [state.answer_timer.started_at, state.answer_timer.duration]}
+
+class SharedSnapshot:
+    # Dernier instantané de l'afficheur en mémoire partagée : numéro de version, longueur, puis le JSON.
+    # Le numéro est impair pendant une écriture ; un lecteur qui le voit changer en cours de lecture recommence.
+    def __init__(self, name=None, size=SNAPSHOT_SIZE):
+        self.owner = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size if self.owner else 0)
+        if not self.owner:
+            # sinon le processus lecteur détruirait la mémoire partagée en se terminant
+            resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.version = 0
+        self.data = None
+        self.snapshot = None
+        self.needs_redraw = True
+
+    def publish(self, dt=None):
+        data = json.dumps(display_snapshot()).encode()
+        if data == self.data:
+            return
+        if SNAPSHOT_HEADER.size + len(data) > self.memory.size:
+            raise ValueError(f"Instantané trop grand pour la mémoire partagée ({len(data)} octets)")
+        buffer = self.memory.buf
+        SNAPSHOT_HEADER.pack_into(buffer, 0, self.version + 1, 0)
+        buffer[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + len(data)] = data
+        self.version += 2
+        SNAPSHOT_HEADER.pack_into(buffer, 0, self.version, len(data))
+        self.data = data
+
+    def poll(self):
+        # côté afficheur : relit l'instantané s'il a changé, et dit s'il a changé
+        buffer = self.memory.buf
+        while True:
+            version, length = SNAPSHOT_HEADER.unpack_from(buffer)
+            if version == self.version or version == 0:
+                return False
+            if version % 2:
+                continue
+            data = bytes(buffer[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + length])
+            if SNAPSHOT_HEADER.unpack_from(buffer)[0] == version:
+                self.version, self.snapshot = version, json.loads(data)
+                return True
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def gif_names(directory=GIFS_DIR):
+    return sorted(gif_file[:-4] for gif_file in os.listdir(directory) if gif_file.lower().endswith(".gif"))
+
+class GifLibrary(pg.event.EventDispatcher):
+    # GIF décodés à la demande dans un thread, réduits à la largeur où ils sont affichés (à nouveau si la fenêtre
+    # change de taille), avec leurs voisins d'avance. Seules les animations les plus récemment choisies restent en mémoire ;
+    # les images d'une animation partagent les textures de son propre TextureBin, libéré avec elle.
+    def __init__(self, directory=GIFS_DIR, width=DISPLAY_WINDOW_WIDTH//3, resident=GIF_RESIDENT):
+        self.directory = directory
+        self.names = gif_names(directory)
+        self.width = width
+        self.resident = resident
+        self.animations = OrderedDict() # ordre LRU : la plus ancienne en premier
+        self._wanted = []
+        self._requested = set()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def select(self, name):
+        # l'animation si elle est prête, sinon None ; dans les deux cas, elle et ses voisines sont demandées
+        index = self.names.index(name)
+        self._wanted = [name]
+        for distance in range(1, GIF_PREFETCH_RADIUS + 1):
+            for neighbour in (self.names[(index + distance) % len(self.names)],
+                              self.names[(index - distance) % len(self.names)]):
+                if neighbour not in self._wanted:
+                    self._wanted.append(neighbour)
+        for wanted in self._wanted:
+            if wanted not in self.animations and wanted not in self._requested:
+                self._requested.add(wanted)
+                self._queue.put(wanted)
+        if name in self.animations:
+            self.animations.move_to_end(name)
+            return self.animations[name]
+        return None
+
+    def set_width(self, width):
+        # les animations déjà réduites ne servent plus : elles seront redécodées à la demande
+        if width == self.width:
+            return
+        self.width = width
+        self.animations.clear()
+        self._requested.clear()
+
+    def decode(self, name, width):
+        animation = pg.image.load_animation(os.path.join(self.directory, f"{name}.gif"))
+        frames = [(frame.image, frame.duration) for frame in animation.frames]
+        if len(frames) > GIF_MAX_FRAMES:
+            group = -(-len(frames) // GIF_MAX_FRAMES)
+            frames = [(frames[idx][0], sum(duration or 0 for _, duration in frames[idx:idx+group]))
+                      for idx in range(0, len(frames), group)]
+        scaled_frames = []
+        for image, duration in frames:
+            image_data = image.get_image_data()
+            pixels = np.frombuffer(image_data.get_data("RGBA", image_data.width*4), dtype=np.uint8)
+            pixels = pixels.reshape(image_data.height, image_data.width, 4)
+            height = max(1, round(image_data.height * width / image_data.width))
+            scaled = resize_pixels(pixels, height, width)
+            scaled_frames.append((pg.image.ImageData(width, height, "RGBA", scaled.tobytes()), duration))
+        return scaled_frames
+
+    def _work(self):
+        while True:
+            name = self._queue.get()
+            width = self.width
+            try:
+                frames = self.decode(name, width)
+            except Exception as e:
+                print(f"GIF illisible ({name}) : {e}")
+                frames = None
+            # l'envoi au GPU doit se faire dans le thread principal
+            pg.app.platform_event_loop.post_event(self, "on_gif_decoded", name, width, frames)
+
+    def on_gif_decoded(self, name, width, frames):
+        if width != self.width: # décodé avant un redimensionnement : une nouvelle demande suivra
+            return
+        self._requested.discard(name)
+        if not frames:
+            return
+        texture_bin = pg.image.atlas.TextureBin()
+        self.animations[name] = pg.image.Animation([pg.image.AnimationFrame(texture_bin.add(image), duration)
+                                                    for image, duration in frames])
+        while len(self.animations) > self.resident:
+            victim = next((other for other in self.animations if other not in self._wanted), None)
+            if not victim:
+                break
+            del self.animations[victim]
+        self.dispatch_event("on_gif_ready", name)
+
+GifLibrary.register_event_type("on_gif_decoded")
+GifLibrary.register_event_type("on_gif_ready")
+
 class DisplayWindow(pg.window.Window):
-    def __init__(self):
+    # Dessine un instantané de display_snapshot() : celui de l'état du jeu, ou celui publié en mémoire partagée
+    # quand l'afficheur tourne dans son propre processus (local=False : pochettes et GIF chargés ici).
+    def __init__(self, source=display_snapshot, local=True, output=1):
         super(DisplayWindow, self).__init__(DISPLAY_WINDOW_WIDTH,
                                             DISPLAY_WINDOW_HEIGHT,
                                             resizable=True,
-                                            caption="Blind - Afficheur")
-        self.set_location(50,50)
+                                            caption="Blind - Afficheur" if output == 1 else f"Blind - Afficheur {output}")
+        self.set_location(50*output, 50*output)
+        self.frame_timer = FrameTimer("Afficheur")
+        self.source = source
+        self.local = local
+        self.snapshot = source()
+        self.answer_timer = AnswerTimer()
+        self.covers = OrderedDict() # pochettes chargées par un afficheur séparé
+        self.gif_library = GifLibrary(width=self.width//3)
+        self.gif_library.push_handlers(on_gif_ready=self.on_gif_ready)
+
+        # Tout est dessiné en un seul appel, dans l'ordre des groupes
+        self.batch = pg.graphics.Batch()
+        background_group = pg.graphics.OrderedGroup(0)
+        timer_group = pg.graphics.OrderedGroup(1)
+        cover_group = pg.graphics.OrderedGroup(2)
+        labels_group = pg.graphics.OrderedGroup(3)
+        leaderboard_background_group = pg.graphics.OrderedGroup(4)
+        leaderboard_group = pg.graphics.OrderedGroup(5)
+        self.gif_group = pg.graphics.OrderedGroup(6)
 
         self.neutral_image = pg.image.load(os.path.join(IMAGES_DIR, NEUTRAL_IMAGE)).get_texture()
         self.background_image = pg.image.load(os.path.join(IMAGES_DIR, BACKGROUND_IMAGE)).get_texture()
         self.buzzer_image = pg.image.load(os.path.join(IMAGES_DIR, BUZZER_IMAGE)).get_texture()
 
+        self.background_sprite = pg.sprite.Sprite(self.background_image, batch=self.batch, group=background_group)
+        self.cover_sprite = pg.sprite.Sprite(self.neutral_image, batch=self.batch, group=cover_group)
+        self.leaderboard_background_sprite = pg.sprite.Sprite(self.background_image,
+                                                              batch=self.batch,
+                                                              group=leaderboard_background_group)
+        self.leaderboard_background_sprite.visible = False
+        self.gif_sprite = None
+
         self.current_artist_label = pg.text.Label("Artiste",
                                                   font_name=DISPLAY_WINDOW_FONT,
                                                   font_size=0,
@@ -408,7 +1520,9 @@ class DisplayWindow(pg.window.Window):
                                                   y=0,
                                                   anchor_x="left",
                                                   anchor_y="bottom",
-                                                  color=(0,0,0,255))
+                                                  color=(0,0,0,255),
+                                                  batch=self.batch,
+                                                  group=labels_group)
         self.current_title_label = pg.text.Label("Titre",
                                                  font_name=DISPLAY_WINDOW_FONT,
                                                  font_size=0,
@@ -416,7 +1530,9 @@ class DisplayWindow(pg.window.Window):
                                                  y=0,
                                                  anchor_x="left",
                                                  anchor_y="bottom",
-                                                 color=(0,0,0,255))
+                                                 color=(0,0,0,255),
+                                                 batch=self.batch,
+                                                 group=labels_group)
         self.artist_found_by_label = pg.text.Label("",
                                                    font_name=DISPLAY_WINDOW_FONT,
                                                    font_size=0,
@@ -424,7 +1540,9 @@ class DisplayWindow(pg.window.Window):
                                                    y=0,
                                                    anchor_x="left",
                                                    anchor_y="bottom",
-                                                   color=(0,100,0,255))
+                                                   color=(0,100,0,255),
+                                                   batch=self.batch,
+                                                   group=labels_group)
         self.title_found_by_label = pg.text.Label("",
                                                   font_name=DISPLAY_WINDOW_FONT,
                                                   font_size=0,
@@ -432,10 +1550,12 @@ class DisplayWindow(pg.window.Window):
                                                   y=0,
                                                   anchor_x="left",
                                                   anchor_y="bottom",
-                                                  color=(0,100,0,255))
-        self.timer_bar = pg.shapes.Rectangle(0, 0, 0, 0, color=(0,0,0))
+                                                  color=(0,100,0,255),
+                                                  batch=self.batch,
+                                                  group=labels_group)
+        self.timer_bar = pg.shapes.Rectangle(0, 0, 0, 0, color=(0,0,0), batch=self.batch, group=timer_group)
 
-        self.leaderboard_label = pg.text.Label("Leaderboard",
+        self.leaderboard_label = pg.text.Label("",
                                                font_name=DISPLAY_WINDOW_FONT,
                                                font_size=0,
                                                x=0,
@@ -445,7 +1565,9 @@ class DisplayWindow(pg.window.Window):
                                                align="center",
                                                anchor_x="center",
                                                anchor_y="center",
-                                               color=(0,0,0,255))
+                                               color=(0,0,0,255),
+                                               batch=self.batch,
+                                               group=leaderboard_group)
 
         self.answering_team_label = pg.text.Label("",
                                                   font_name=DISPLAY_WINDOW_FONT,
@@ -457,55 +1579,74 @@ class DisplayWindow(pg.window.Window):
                                                   align="center",
                                                   anchor_x="center",
                                                   anchor_y="center",
-                                                  color=(255,255,255,255))
-
-
-    def on_draw(self):
-        self.clear()
-        self.background_image.blit(0,0,1)
-
-        track = state.selected_track
-
-        if state.step == STEP_ANSWERING:
-            self.cover_image = self.buzzer_image
-        elif track.artist_revealed and track.title_revealed:
-            self.cover_image = track.cover
+                                                  color=(255,255,255,255),
+                                                  batch=self.batch,
+                                                  group=labels_group)
+
+        self.layout_key = None
+        self.timer_value = None
+        self.needs_redraw = True
+
+    def is_animating(self):
+        layout = self.snapshot["layout"]
+        return self.answer_timer.running or bool(layout["gif"] and layout["gif_visible"])
+
+    def current_layout_key(self):
+        # tout ce dont dépend la mise en page ; la barre de timer est traitée à part
+        return (self.width, self.height, self.snapshot["layout"])
+
+    def load_cover(self, cover_file):
+        if self.local:
+            return state.selected_track.cover # textures déjà préparées par TrackStore
+        if cover_file not in self.covers:
+            self.covers[cover_file] = pg.image.load(cover_file).get_texture()
+            while len(self.covers) > 2:
+                self.covers.popitem(last=False)
+        return self.covers[cover_file]
+
+    def resize_gifs(self, dt):
+        self.gif_library.set_width(self.width//3)
+        self.layout_key = None
+        self.needs_redraw = True
+
+    def on_gif_ready(self, name):
+        if name == self.snapshot["layout"]["gif"]:
+            self.layout_key = None
+            self.needs_redraw = True
+
+    def layout(self):
+        layout = self.snapshot["layout"]
+
+        if layout["step"] == STEP_ANSWERING:
+            cover_image = self.buzzer_image
+        elif layout["cover_file"]:
+            cover_image = self.load_cover(layout["cover_file"])
         else:
-            self.cover_image = self.neutral_image
+            cover_image = self.neutral_image
 
-        self.cover_image.width = self.height*0.7
-        self.cover_image.height = self.cover_image.width
-        self.cover_image.anchor_x = self.cover_image.width//2
-        self.cover_image.anchor_y = self.cover_image.height//2
-        self.cover_image.x = self.width//2 # placé dans `image` artificiellement, utile pour dessiner la barre de timer
-        self.cover_image.y = self.height*0.6
+        if cover_image is not self.cover_sprite.image:
+            cover_image.anchor_x = cover_image.width//2
+            cover_image.anchor_y = cover_image.height//2
+            self.cover_sprite.image = cover_image
+        cover_size = self.height*COVER_HEIGHT_RATIO
+        self.cover_sprite.update(x=self.width//2, y=self.height*0.6, scale=cover_size/cover_image.width)
 
-        if track.artist_revealed:
-            self.current_artist_label.text = track.artist
+        if layout["artist"] is not None:
+            self.current_artist_label.text = layout["artist"]
             self.current_artist_label.color = (0,0,0,255)
         else:
             self.current_artist_label.text = "Artiste ?"
             self.current_artist_label.color = (100,100,100,255)
 
-        if track.title_revealed:
-            self.current_title_label.text = track.title
+        if layout["title"] is not None:
+            self.current_title_label.text = layout["title"]
             self.current_title_label.color = (0,0,0,255)
         else:
             self.current_title_label.text = "Titre ?"
             self.current_title_label.color = (100,100,100,255)
 
-        if track.artist_found_by:
-            self.artist_found_by_label.text = track.artist_found_by.name
-        else:
-            self.artist_found_by_label.text = ""
-
-        if track.title_found_by:
-            self.title_found_by_label.text = track.title_found_by.name
-        else:
-            self.title_found_by_label.text = ""
-
-        self.current_artist_label.draw()
-        self.current_title_label.draw()
+        self.artist_found_by_label.text = layout["artist_found_by"] or ""
+        self.title_found_by_label.text = layout["title_found_by"] or ""
 
         self.artist_found_by_label.x = (self.current_artist_label.x +
                                         self.current_artist_label.content_width +
@@ -513,44 +1654,66 @@ class DisplayWindow(pg.window.Window):
         self.title_found_by_label.x = (self.current_title_label.x +
                                        self.current_title_label.content_width +
                                        self.width*0.02)
-        self.artist_found_by_label.y = self.current_artist_label.y + self.height*0.02
-        self.title_found_by_label.y = self.current_title_label.y + self.height*0.02
-        self.artist_found_by_label.draw()
-        self.title_found_by_label.draw()
-
-        self.timer_bar.x = self.cover_image.x - self.cover_image.width//2 - self.width*0.05
-        self.timer_bar.y = self.cover_image.y - self.cover_image.height//2
-        self.timer_bar.width = self.cover_image.width + (2*self.width*0.05)
-        self.timer_bar.height = state.timer * self.cover_image.height
-        self.timer_bar.draw()
 
-        self.cover_image.blit(self.cover_image.x, self.cover_image.y, 1) # blit tardif, pour qu'il ait lieu par dessus
-                                                                         # la barre de timer
+        self.timer_bar.x = self.cover_sprite.x - cover_size//2 - self.width*0.05
+        self.timer_bar.y = self.cover_sprite.y - cover_size//2
+        self.timer_bar.width = cover_size + (2*self.width*0.05)
+        self.timer_value = None
 
-        if state.step == STEP_ANSWERING:
-            self.answering_team_label.text = state.last_team_to_buzz.name
-        else:
-            self.answering_team_label.text = ""
-        self.answering_team_label.draw()
-        
-        if state.leaderboard_visible:
+        self.answering_team_label.text = layout["answering_team"] or ""
+
+        if layout["leaderboard"] is not None:
             scores_string = ""
-            for team in state.teams:
-                scores_string += f"{team.name} : {str(team.score)}\n"
-            scores_string = scores_string.strip()
-            self.leaderboard_label.text = scores_string
+            for name, score in layout["leaderboard"]:
+                scores_string += f"{name} : {str(score)}\n"
+            self.leaderboard_label.text = scores_string.strip()
+        else:
+            self.leaderboard_label.text = ""
+        self.leaderboard_background_sprite.visible = layout["leaderboard"] is not None
+
+        # un seul sprite, dont on change l'animation ; None tant que le GIF choisi n'est pas encore décodé
+        animation = self.gif_library.select(layout["gif"]) if layout["gif"] else None
+        if animation and not self.gif_sprite:
+            self.gif_sprite = pg.sprite.Sprite(animation, batch=self.batch, group=self.gif_group)
+        elif animation and animation is not self.gif_sprite.image:
+            self.gif_sprite.image = animation
+        if self.gif_sprite:
+            if animation:
+                self.gif_sprite.scale = (self.width/3) / (self.gif_sprite.width/self.gif_sprite.scale)
+                self.gif_sprite.position = (self.width - self.gif_sprite.width - self.width//20, 0)
+            self.gif_sprite.visible = bool(animation) and layout["gif_visible"]
+
+    def on_draw(self):
+        with self.frame_timer:
+            self.draw()
+
+    def draw(self):
+        self.clear()
 
-            self.background_image.blit(0,0,1)
-            self.leaderboard_label.draw()
+        self.snapshot = self.source()
+        self.answer_timer.started_at, self.answer_timer.duration = self.snapshot["timer"]
 
-        if state.gifs and state.gif_visible:
-            state.gifs[0]["sprite"].scale *= ((self.width/3) / state.gifs[0]["sprite"].width)
-            state.gifs[0]["sprite"].y = 0
-            state.gifs[0]["sprite"].x = self.width - state.gifs[0]["sprite"].width - self.width//20
-            state.gifs[0]["sprite"].draw()
+        layout_key = self.current_layout_key()
+        if layout_key != self.layout_key:
+            self.layout()
+            self.layout_key = layout_key
+
+        timer = self.answer_timer.fraction
+        if timer != self.timer_value:
+            self.timer_bar.height = timer * self.height*COVER_HEIGHT_RATIO
+            self.timer_value = timer
+
+        self.batch.draw()
 
     def on_resize(self, width, height):
-        self.background_image.width, self.background_image.height = width, height
+        # une fois le redimensionnement terminé, pour ne pas redécoder les GIF à chaque étape
+        pg.clock.unschedule(self.resize_gifs)
+        pg.clock.schedule_once(self.resize_gifs, GIF_RESIZE_DELAY)
+
+        self.background_sprite.update(scale_x=width/self.background_image.width,
+                                      scale_y=height/self.background_image.height)
+        self.leaderboard_background_sprite.update(scale_x=width/self.background_image.width,
+                                                  scale_y=height/self.background_image.height)
 
         self.current_artist_label.x = width*0.02
         self.current_title_label.x = width*0.02
@@ -558,9 +1721,11 @@ class DisplayWindow(pg.window.Window):
         self.current_title_label.y = height*0.02
         self.current_artist_label.font_size = height//15
         self.current_title_label.font_size = height//15
-        
+
         self.artist_found_by_label.font_size = height//30
         self.title_found_by_label.font_size = height//30
+        self.artist_found_by_label.y = self.current_artist_label.y + height*0.02
+        self.title_found_by_label.y = self.current_title_label.y + height*0.02
 
         self.leaderboard_label.x = width*0.5
         self.leaderboard_label.y = height*0.5
@@ -572,13 +1737,16 @@ class DisplayWindow(pg.window.Window):
         self.answering_team_label.font_size = height//8
         self.answering_team_label.width = width*0.5
 
+        self.layout_key = None # le reste de la mise en page dépend de la taille, elle sera refaite au prochain dessin
+        self.needs_redraw = True
+
         super(DisplayWindow, self).on_resize(width, height) # https://stackoverflow.com/a/23276270/602339
 
     def on_activate(self):
-        self.dispatch_event("on_draw")
+        self.needs_redraw = True
 
     def on_expose(self):
-        self.dispatch_event("on_draw")
+        self.needs_redraw = True
 
     def on_key_press(self, symbol, modifiers): # empêche Esc de fermer la fenêtre
         pass
@@ -586,19 +1754,461 @@ class DisplayWindow(pg.window.Window):
     def on_close(self):
         sys.exit()
 
+# Effets sonores
+################
+
+class SoundEffects:
+    # Lecteurs préparés d'avance : le lecteur du pilote audio existe déjà, déclencher un effet n'est qu'un play().
+    # Une voix qui a fini de jouer est réarmée aussitôt, hors du chemin critique.
+    # La latence mesurée va de l'appui au retour de play(). Ni le tampon du pilote ni sa sortie n'y sont :
+    # pyglet 1.5 fixe la taille des tampons dans ses pilotes et n'expose pas la position de sortie.
+    def __init__(self, effects, voices=SFX_VOICES):
+        self.sources = {name: pg.media.load(os.path.join(FX_DIR, filename), streaming=False)
+                        for name, filename in effects.items()}
+        self.idle = {name: deque() for name in effects}
+        self.latencies = deque(maxlen=1000)
+        for name in effects:
+            for _ in range(voices):
+                self._arm(name, self._create_player(name))
+
+    def _create_player(self, name):
+        player = pg.media.Player()
+        player.set_handler("on_player_eos", lambda: self._arm(name, player))
+        return player
+
+    def _arm(self, name, player):
+        player.queue(self.sources[name])
+        # pyglet 1.5 ne crée le lecteur du pilote qu'au premier play(). Ce play() muet a pu consommer le début
+        # de l'effet : seek(0) vide les tampons et revient au début, chaque play() les remplit à nouveau.
+        player.volume = 0
+        player.play()
+        player.pause()
+        player.seek(0)
+        player.volume = 1
+        self.idle[name].append(player)
+
+    def play(self, name, pressed_at=None):
+        if self.idle[name]:
+            player = self.idle[name].popleft()
+        else: # toutes les voix jouent déjà : une voix de plus, préparée à froid
+            player = self._create_player(name)
+            player.queue(self.sources[name])
+        player.play()
+        if pressed_at is not None:
+            self.latencies.append(time() - pressed_at)
+
+    def report(self):
+        if not self.latencies:
+            return "Appui → retour de play() : aucune mesure"
+        latencies = sorted(self.latencies)
+        return (f"Appui → retour de play() (hors tampon et sortie du pilote audio) : "
+                f"médiane {1000*latencies[len(latencies)//2]:.1f} ms, "
+                f"p95 {1000*latencies[int(0.95*(len(latencies)-1))]:.1f} ms, max {1000*latencies[-1]:.1f} ms "
+                f"({len(latencies)} buzz)")
+
+# Buzzers
+#########
+
+def evdev_button_numbers(fd):
+    # même numérotation que pyglet : rang du code parmi les touches que déclare le périphérique
+    bits = bytearray(KEY_CNT // 8)
+    try:
+        fcntl.ioctl(fd, EVIOCGBIT_KEY, bits)
+    except OSError: # pas un vrai périphérique (tube de test) : codes à partir de BTN_JOYSTICK
+        return None
+    codes = [code for code in range(KEY_CNT) if bits[code // 8] >> (code % 8) & 1]
+    return {code: number for number, code in enumerate(codes)}
+
+def stable_device_id(key):
+    # /dev/input/eventN dépend de l'ordre de détection : on lui préfère le numéro de série du boîtier (uniq),
+    # sinon le port où il est branché (phys), lus dans sysfs. Deux boîtiers identiques sans numéro de série
+    # partageraient leur lien de /dev/input/by-id, c'est pourquoi celui-ci n'est pas utilisé.
+    if key.startswith("/dev/input/event"):
+        sysfs = os.path.join("/sys/class/input", os.path.basename(key), "device")
+        for attribute in ("uniq", "phys"):
+            try:
+                with open(os.path.join(sysfs, attribute), "r") as f:
+                    value = f.read().strip()
+            except OSError:
+                continue
+            if value:
+                return f"{attribute}:{value}"
+    return key
+
+class EvdevReader(threading.Thread):
+    # Lit les événements bruts des boîtiers avec l'horodatage du noyau, hors de la boucle pyglet,
+    # et les poste au thread principal.
+    def __init__(self, hub):
+        super(EvdevReader, self).__init__(daemon=True)
+        self.hub = hub
+        self._devices = {} # descripteur -> [boîtier, numéros de boutons, octets en attente]
+        self._lock = threading.Lock()
+        self._wakeup_read, self._wakeup_write = os.pipe()
+
+    def add(self, number, path):
+        # un tube est ouvert en lecture-écriture, pour ne pas lire une fin de fichier sans arrêt en l'absence d'écrivain
+        mode = os.O_RDWR if stat.S_ISFIFO(os.stat(path).st_mode) else os.O_RDONLY
+        fd = os.open(path, mode | os.O_NONBLOCK)
+        with self._lock:
+            self._devices[fd] = [number, evdev_button_numbers(fd), b""]
+        os.write(self._wakeup_write, b"\0")
+
+    def remove(self, number):
+        with self._lock:
+            for fd, device in list(self._devices.items()):
+                if device[0] == number:
+                    del self._devices[fd]
+                    os.close(fd)
+        os.write(self._wakeup_write, b"\0")
+
+    def run(self):
+        while True:
+            with self._lock:
+                fds = list(self._devices)
+            readable, _, _ = select.select(fds + [self._wakeup_read], [], [])
+            for fd in readable:
+                if fd == self._wakeup_read:
+                    os.read(fd, 64)
+                    continue
+                with self._lock:
+                    device = self._devices.get(fd)
+                    if not device:
+                        continue
+                    try:
+                        data = device[2] + os.read(fd, EVDEV_EVENT.size * 64)
+                    except OSError: # boîtier débranché : on arrête de le surveiller, le scan le signalera
+                        del self._devices[fd]
+                        os.close(fd)
+                        continue
+                    complete = len(data) - len(data) % EVDEV_EVENT.size
+                    device[2] = data[complete:]
+                number, buttons = device[0], device[1]
+                for seconds, microseconds, event_type, code, value in EVDEV_EVENT.iter_unpack(data[:complete]):
+                    if event_type != EV_KEY or value not in (0, 1):
+                        continue
+                    button = buttons.get(code) if buttons is not None else code - BTN_JOYSTICK
+                    if button is not None:
+                        pg.app.platform_event_loop.post_event(self.hub, "on_buzzer_raw",
+                                                              seconds + microseconds / 1e6, number, button, value == 1)
+
+class FakeEvdevDevice:
+    # Remplaçant d'un boîtier pour les tests : un tube nommé qui reçoit des événements evdev.
+    # À passer à `play --evdev-device`.
+    def __init__(self, directory=None, path=None):
+        # avec path, écrit dans un tube déjà créé (par exemple par `bench`, dans un autre processus)
+        self.created = path is None
+        self.path = path or os.path.join(directory or tempfile.mkdtemp(prefix="blind-"), "fake-event")
+        if self.created:
+            os.mkfifo(self.path)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+
+    def press(self, button, timestamp=None, release=True):
+        timestamp = time() if timestamp is None else timestamp
+        seconds, microseconds = int(timestamp), int(timestamp % 1 * 1e6)
+        data = EVDEV_EVENT.pack(seconds, microseconds, EV_KEY, BTN_JOYSTICK + button, 1)
+        if release:
+            data += EVDEV_EVENT.pack(seconds, microseconds, EV_KEY, BTN_JOYSTICK + button, 0)
+        os.write(self._fd, data)
+
+    def close(self):
+        os.close(self._fd)
+        if self.created:
+            os.remove(self.path)
+
+class BuzzArbiter:
+    # Retient les appuis pendant une courte fenêtre, puis les transmet dans l'ordre de leurs horodatages :
+    # le jeu retient le premier appui valable, celui qui a vraiment appuyé le premier.
+    def __init__(self, hub, window):
+        self.hub = hub
+        self.window = window
+        self.pending = []
+
+    def press(self, timestamp, device, button):
+        if not self.window:
+            self.hub.dispatch_event("on_buzzer_press", device, button, timestamp)
+            return
+        self.pending.append((timestamp, device, button))
+        if len(self.pending) == 1:
+            pg.clock.schedule_once(self.decide, self.window)
+
+    def decide(self, dt):
+        presses, self.pending = sorted(self.pending), []
+        if len(presses) > 1:
+            (first, device, button), (second, other_device, other_button) = presses[:2]
+            print(f"Buzz : boîtier {device} bouton {button} devant boîtier {other_device} bouton {other_button} "
+                  f"de {1000*(second - first):.1f} ms ({len(presses)} appuis)")
+        for timestamp, device, button in presses:
+            self.hub.dispatch_event("on_buzzer_press", device, button, timestamp)
+
+class BuzzerHub(pg.event.EventDispatcher):
+    # Regroupe tous les joysticks branchés en un seul flux d'événements (boîtier, bouton).
+    # Les boîtiers sont numérotés à partir de 1 ; un boîtier garde son numéro d'une partie à l'autre (DEVICES_FILE),
+    # quel que soit l'ordre dans lequel le système les détecte.
+    # Avec le backend evdev, les boutons sont lus par un thread dédié et départagés par BuzzArbiter.
+    # Le backend virtual n'ouvre aucun périphérique : seuls les événements postés (rejeu, tempête) l'alimentent.
+    def __init__(self, backend=DEFAULT_INPUT_BACKEND, arbitration_window=0, device_paths=(),
+                 devices_file=DEVICES_FILE):
+        self.backend = backend
+        self.joysticks = {}
+        self.devices_file = devices_file
+        try:
+            with open(devices_file, "r") as f:
+                self._numbers = json.load(f) # identifiant stable -> numéro
+        except FileNotFoundError:
+            self._numbers = {}
+        self.arbiter = BuzzArbiter(self, arbitration_window)
+        self.evdev_reader = None
+        if backend == "evdev":
+            self.evdev_reader = EvdevReader(self)
+            self.evdev_reader.start()
+        if device_paths:
+            for number, path in enumerate(device_paths, start=1):
+                self.evdev_reader.add(number, path)
+                self.joysticks[number] = path
+                print(f"Boîtier {number} : {path}")
+        elif backend != "virtual":
+            self.scan()
+
+    def on_buzzer_raw(self, timestamp, device, button, pressed):
+        if pressed:
+            self.arbiter.press(timestamp, device, button)
+        else:
+            self.dispatch_event("on_buzzer_release", device, button)
+
+    @staticmethod
+    def device_key(joystick):
+        return getattr(joystick.device, "_filename", None) or joystick.device.name
+
+    @staticmethod
+    def is_present(key):
+        # pyglet garde en cache les périphériques evdev, même débranchés : on vérifie que le fichier existe encore
+        return not key.startswith("/dev/") or os.path.exists(key)
+
+    def number(self, key):
+        stable_id = stable_device_id(key)
+        if stable_id not in self._numbers:
+            self._numbers[stable_id] = max(self._numbers.values(), default=0) + 1
+            temp_path = f"{self.devices_file}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self._numbers, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.devices_file)
+        return self._numbers[stable_id]
+
+    def scan(self, dt=None):
+        joysticks = {self.device_key(joystick): joystick for joystick in pg.input.get_joysticks()}
+        for key in sorted(joysticks):
+            number = self.number(key)
+            if number not in self.joysticks and self.is_present(key):
+                self._open(number, joysticks[key])
+
+        for number, joystick in list(self.joysticks.items()):
+            key = self.device_key(joystick)
+            if key not in joysticks or not self.is_present(key):
+                del self.joysticks[number]
+                if self.evdev_reader:
+                    self.evdev_reader.remove(number)
+                else:
+                    joystick.close()
+                print(f"Boîtier {number} débranché")
+
+    def _open(self, number, joystick):
+        try:
+            if self.evdev_reader:
+                self.evdev_reader.add(number, joystick.device._filename)
+            else:
+                joystick.open()
+        except (pg.input.DeviceOpenException, OSError, AttributeError) as e:
+            print(f"Boîtier {number} inutilisable : {e}")
+            return
+        if not self.evdev_reader:
+            joystick.push_handlers(on_joybutton_press=lambda _, button: self.dispatch_event("on_buzzer_press", number, button, time()),
+                                   on_joybutton_release=lambda _, button: self.dispatch_event("on_buzzer_release", number, button))
+        self.joysticks[number] = joystick
+        print(f"Boîtier {number} : {joystick.device.name} ({stable_device_id(self.device_key(joystick))})")
+
+BuzzerHub.register_event_type("on_buzzer_raw")
+BuzzerHub.register_event_type("on_buzzer_press")
+BuzzerHub.register_event_type("on_buzzer_release")
+
+class EventRecorder:
+    # Enregistre les appuis et relâchements des boîtiers pendant une partie, une ligne JSON par événement
+    def __init__(self, path):
+        self.file = open(path, "a", buffering=1)
+
+    def write(self, timestamp, device, button, pressed):
+        self.file.write(json.dumps({"time": timestamp, "device": device, "button": button, "pressed": pressed}) + "\n")
+
+    def on_buzzer_press(self, device, button, timestamp):
+        self.write(timestamp, device, button, True)
+
+    def on_buzzer_release(self, device, button):
+        self.write(time(), device, button, False)
+
+def load_recorded_events(path):
+    # [] pour un enregistrement vide
+    with open(path, "r") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    if not events:
+        return []
+    events.sort(key=lambda event: event["time"])
+    return [(event["time"] - events[0]["time"], event["device"], event["button"], event["pressed"]) for event in events]
+
+def storm_events(buttons, rate, duration):
+    # appuis de boutons pris au hasard, arrivées de Poisson à `rate` appuis par seconde
+    events = []
+    offset = random.expovariate(rate)
+    while offset < duration:
+        device, button = random.choice(buttons)
+        events.append((offset, device, button, True))
+        events.append((offset + REPLAY_RELEASE_DELAY, device, button, False))
+        offset += random.expovariate(rate)
+    events.sort()
+    return events
+
+class EventReplayer(threading.Thread):
+    # Poste des événements (décalage en secondes, boîtier, bouton, appui) au hub depuis un thread,
+    # comme le ferait EvdevReader. speed 1 : temps réel, 0 : aussi vite que possible.
+    def __init__(self, hub, events, speed=1):
+        super(EventReplayer, self).__init__(daemon=True)
+        self.hub = hub
+        self.events = events
+        self.speed = speed
+        self.posted = set() # (boîtier, bouton, horodatage) des appuis postés
+        self.releases = 0
+        self.elapsed = 0
+
+    def run(self):
+        start = time()
+        for offset, device, button, pressed in self.events:
+            if self.speed:
+                timestamp = start + offset / self.speed
+                sleep(max(0, timestamp - time()))
+            else:
+                timestamp = time()
+            if pressed:
+                self.posted.add((device, button, timestamp))
+            else:
+                self.releases += 1
+            pg.app.platform_event_loop.post_event(self.hub, "on_buzzer_raw", timestamp, device, button, pressed)
+        self.elapsed = time() - start
+
+class ReplayMonitor:
+    # Fait tourner la partie pendant un rejeu (lance les pistes, reprend après chaque buzz)
+    # et compte les appuis perdus, en retard, ou attribués à une autre équipe que la plus rapide.
+    def __init__(self, replayer, late_threshold):
+        self.replayer = replayer
+        self.late_threshold = late_threshold
+        self.delivered = set()
+        self.latencies = []
+        self.unknown = 0
+        self.accepted = 0
+        self.misattributed = 0
+        self.pending = None # dernier appui reçu, pas encore départagé
+        self.winner = None # (équipe, horodatage, équipes qui pouvaient buzzer) du buzz en cours
+        self.answered_at = 0
+        self.tracks_played = 0
+        self.ending = False
+        self.finishing = False
+
+    def start(self):
+        # à appeler après l'enregistrement des gestionnaires du jeu : le moniteur passe avant eux
+        self.replayer.hub.push_handlers(on_buzzer_press=self.on_buzzer_press)
+        pg.clock.schedule_interval(self.drive, REPLAY_DRIVE_INTERVAL)
+        self.replayer.start()
+
+    def settle(self):
+        # le gestionnaire du jeu a traité l'appui en attente : a-t-il donné la main à son équipe ?
+        if not self.pending:
+            return
+        team, timestamp, eligible, step = self.pending
+        self.pending = None
+        if step == STEP_PLAYING and state.step == STEP_ANSWERING and state.last_team_to_buzz is team:
+            self.accepted += 1
+            self.winner = (team, timestamp, eligible)
+            self.answered_at = time()
+
+    def on_buzzer_press(self, device, button, timestamp):
+        self.settle()
+        self.delivered.add((device, button, timestamp))
+        self.latencies.append(time() - timestamp)
+        if not (team := state.get_team_by_button_id(device, button)):
+            self.unknown += 1
+            return
+        if self.winner and state.step == STEP_ANSWERING:
+            winner, winner_timestamp, eligible = self.winner
+            if team is not winner and team in eligible and timestamp < winner_timestamp:
+                self.misattributed += 1 # appuyé avant le gagnant, mais arrivé après lui
+        eligible = {team for team in state.teams if team.can_buzz}
+        self.pending = (team, timestamp, eligible, state.step)
+
+    def drive(self, dt):
+        self.settle()
+        if state.step == STEP_IDLE and not state.player:
+            if self.tracks_played:
+                state.shift_selected_track(1 if state.track_number < len(state.tracks) - 1 else -state.track_number)
+            state.control_window.dispatch_event("on_key_press", pg.window.key.ENTER, 0)
+            self.tracks_played += 1
+            self.ending = False
+        elif state.step == STEP_ANSWERING and time() - self.answered_at >= REPLAY_ANSWER_DELAY:
+            self.winner = None
+            state.control_window.dispatch_event("on_key_press", pg.window.key.ENTER, 0)
+        elif state.step == STEP_PLAYING and not self.ending and not any(team.can_buzz for team in state.teams):
+            self.ending = True # plus personne ne peut buzzer : fondu, puis piste suivante
+            state.control_window.dispatch_event("on_key_press", pg.window.key.ENTER, 0)
+
+        if not self.replayer.is_alive() and not self.finishing:
+            self.finishing = True
+            pg.clock.schedule_once(self.finish, REPLAY_GRACE)
+
+    def finish(self, dt):
+        self.settle()
+        pg.clock.unschedule(self.drive)
+        latencies = sorted(self.latencies)
+        late = sum(1 for latency in latencies if latency > self.late_threshold)
+        print(f"Rejoué : {len(self.replayer.posted)} appuis et {self.replayer.releases} relâchements "
+              f"en {self.replayer.elapsed:.1f} s")
+        print(f"Reçus : {len(self.delivered)}, perdus : {len(self.replayer.posted - self.delivered)}, "
+              f"boutons sans équipe : {self.unknown}")
+        if latencies:
+            print(f"Latence : médiane {1000*latencies[len(latencies)//2]:.1f} ms, "
+                  f"p95 {1000*latencies[int(0.95*(len(latencies)-1))]:.1f} ms, max {1000*latencies[-1]:.1f} ms")
+        print(f"En retard (plus de {1000*self.late_threshold:.0f} ms) : {late}")
+        print(f"Buzz acceptés : {self.accepted} sur {self.tracks_played} pistes, mal attribués : {self.misattributed}")
+        pg.app.exit()
+
 # Classes de jeu
 ################
 
-class State:
+class Watched:
+    # Toute modification d'un attribut public invalide les fenêtres qui l'affichent
+    event_loop = None
+    displayed_attributes = ()
+
+    def __setattr__(self, name, value):
+        super(Watched, self).__setattr__(name, value)
+        if Watched.event_loop and not name.startswith("_"):
+            Watched.event_loop.invalidate(state.control_window)
+            if name in self.displayed_attributes:
+                Watched.event_loop.invalidate(*state.display_outputs)
+
+class State(Watched):
+    displayed_attributes = ("step", "track_number", "timer_expired", "leaderboard_visible", "last_team_to_buzz",
+                            "gifs", "gif_visible")
+
     def __init__(self):
         self.step = STEP_IDLE
-        self._joystick = None
+        self._buzzers = None
         self._teams = []
-        self.tracks = []
+        self._teams_by_button_id = {}
+        self._teams_by_number = {}
+        self._leaderboard = [] # équipes triées par score, tenu à jour à chaque changement de score
+        self._leaderboard_keys = []
+        self.track_store = None
         self.track_number = 0
         self.player = None
-        self.timer = 1
-        self.timer_running = False
+        self.fader = None
+        self.answer_timer = AnswerTimer()
+        self.timer_expired = False
         self.pitch = Decimal("1")
         self.leaderboard_visible = False
         self.last_team_to_buzz = None
@@ -611,21 +2221,42 @@ class State:
         self.retry_timer_duration = None
         self.pause_during_answers = None
         self.fadeout_factor = None
+        self.sound_effects = None
+        self.display_outputs = [] # fenêtre d'affichage, ou mémoire partagée lue par les afficheurs séparés
+        self.metrics = Metrics()
+        self.metrics_visible = False
+        self.input_backend = DEFAULT_INPUT_BACKEND
+        self.arbitration_window = 0
+        self.evdev_devices = ()
+        self.reloader = None
 
     @property
-    def joystick(self):
-        if not self._joystick:
-            joysticks = pg.input.get_joysticks()
-            if not joysticks:
-                print("Aucun joystick connecté")
-                sys.exit()
-            self._joystick = joysticks[0]
-            self._joystick.open()
-        return self._joystick
+    def buzzers(self):
+        if not self._buzzers:
+            self._buzzers = BuzzerHub(self.input_backend, self.arbitration_window, self.evdev_devices)
+            if self.input_backend != "virtual": # le rejeu se passe de boîtiers
+                if not self._buzzers.joysticks:
+                    print("Aucun joystick connecté")
+                    sys.exit()
+                if not self.evdev_devices:
+                    pg.clock.schedule_interval_soft(self._buzzers.scan, JOYSTICK_SCAN_INTERVAL)
+        return self._buzzers
 
     @property
     def teams(self):
-        return sorted(self._teams, key=lambda x: (-x.score, x.name))
+        return self._leaderboard
+
+    @property
+    def tracks(self):
+        return self.track_store.tracks
+
+    @property
+    def timer(self):
+        return self.answer_timer.fraction
+
+    @property
+    def timer_running(self):
+        return self.answer_timer.running
 
     @property
     def selected_track(self):
@@ -634,31 +2265,60 @@ class State:
     def add_team(self, team):
         team.number = len(self._teams) + 1
         self._teams.append(team)
-
-    def get_team_by_button_id(self, button_id):
-        try:
-            team = next(team for team in self._teams if team.button_id == button_id)
-        except StopIteration:
-            team = None
-        return team
+        self._teams_by_button_id.setdefault((team.device, team.button_id), team)
+        self._teams_by_number[team.number] = team
+        self.insert_in_leaderboard(team)
+        team._registry = self
+
+    def replace_teams(self, teams):
+        # nouvelle liste d'équipes, numérotées dans l'ordre ; une équipe gardée conserve son score
+        for team in self._teams:
+            team._registry = None # une équipe retirée ne touche plus au classement
+        self._teams = []
+        self._teams_by_button_id = {}
+        self._teams_by_number = {}
+        self._leaderboard = []
+        self._leaderboard_keys = []
+        for team in teams:
+            team._registry = None
+            self.add_team(team)
+        if self.last_team_to_buzz is not None and self.last_team_to_buzz not in teams:
+            if self.step == STEP_ANSWERING: # l'équipe qui répondait a été retirée : sa réponse est annulée
+                self.step = STEP_PLAYING
+                self.toggle_pause()
+                self.reset_answer_timer()
+            self.last_team_to_buzz = None
+        if Watched.event_loop:
+            Watched.event_loop.invalidate(self.control_window, *self.display_outputs)
+
+    def insert_in_leaderboard(self, team):
+        key = (-team.score, team.name, team.number)
+        idx = bisect.bisect_left(self._leaderboard_keys, key)
+        self._leaderboard_keys.insert(idx, key)
+        self._leaderboard.insert(idx, team)
+
+    def remove_from_leaderboard(self, team):
+        idx = bisect.bisect_left(self._leaderboard_keys, (-team.score, team.name, team.number))
+        del self._leaderboard_keys[idx]
+        del self._leaderboard[idx]
+
+    def get_team_by_button_id(self, device, button_id):
+        return self._teams_by_button_id.get((device, button_id))
 
     def get_team_by_number(self, number):
-        try:
-            team = next(team for team in self._teams if team.number == number)
-        except StopIteration:
-            team = None
-        return team
+        return self._teams_by_number.get(number)
 
     def shift_selected_track(self, offset=1):
         requested_track_number = self.track_number + offset
         if 0 <= requested_track_number < len(self.tracks):
             self.track_number += offset
-            self.display_window.dispatch_event("on_draw")
+            self.track_store.prefetch(self.track_number)
 
     def shift_selected_gif(self, offset=1):
         if not self.gifs:
             return
         self.gifs.rotate(offset)
+        self.gifs = self.gifs # la rotation se fait sur place : on signale le changement
 
     def toggle_pause(self):
         if self.pause_during_answers:
@@ -667,64 +2327,1039 @@ class State:
             else:
                 self.player.play()
         else:
-            if self.player.volume == 1:
-                self.player.volume = 0.1
+            if self.player.volume == self.selected_track.gain:
+                self.player.volume = 0.1 * self.selected_track.gain
             else:
-                self.player.volume = 1
+                self.player.volume = self.selected_track.gain
 
-    def make_quieter(self, dt):
-        if self.player.volume > 0.01:
-            self.player.volume *= self.fadeout_factor
-            return
+    def resume_if_revealed(self):
+        if self.selected_track.title_revealed and self.selected_track.artist_revealed and self.step == STEP_ANSWERING:
+            self.step = STEP_PLAYING
+            self.toggle_pause()
+            self.reset_answer_timer()
 
+    def end_track(self, dt):
         self.player.pause()
         self.player = None
+        self.fader = None
         self.step = STEP_IDLE
-        pg.clock.unschedule(self.make_quieter)
         for team in self.teams:
             team.can_buzz = True
         self.reset_answer_timer()
 
-    def reduce_answer_timer(self, dt):
-        unit = dt / self.answer_timer_duration
-
-        if self.timer > unit:
-            self.timer -= unit
-            return
+    def start_answer_timer(self):
+        self.answer_timer.start(self.answer_timer_duration)
+        self.timer_expired = False
+        pg.clock.schedule_once(self.expire_answer_timer, self.answer_timer_duration)
 
-        self.timer = 0
-
-        pg.clock.unschedule(self.reduce_answer_timer)
+    def expire_answer_timer(self, dt):
+        self.timer_expired = True
 
     def restore_buzzer(self, dt, team):
         team.can_buzz = True
 
     def reset_answer_timer(self):
-        self.timer = 1
-        self.timer_running = False
-        pg.clock.unschedule(self.reduce_answer_timer)
+        self.answer_timer.reset()
+        self.timer_expired = False
+        pg.clock.unschedule(self.expire_answer_timer)
 
     def reset_track(self):
-        pg.clock.schedule_interval(self.make_quieter, 0.1)
+        pg.clock.unschedule(self.end_track) # un second Entrée pendant le fondu ne le relance pas
+        duration = self.fader.fade_out(self.fadeout_factor, self.player.time)
+        # la courbe atteint le plancher quand la lecture arrive à sa fin, au rythme de la vitesse de lecture
+        pg.clock.schedule_once(self.end_track, duration / self.player.pitch)
+
+class Team(Watched):
+    displayed_attributes = ("name", "score")
 
-class Team:
-    def __init__(self, name="NAME", score=0, button_id=0):
+    def __init__(self, name="NAME", score=0, button_id=0, device=1):
+        self._registry = None
         self.name = name
         self.score = score
         self.can_buzz = True
         self.button_id = button_id
+        self.device = device
+
+    def __setattr__(self, name, value):
+        # le classement de l'état est déplacé d'une seule équipe quand son score ou son nom change
+        registry = self.__dict__.get("_registry")
+        if registry and name in ("score", "name"):
+            registry.remove_from_leaderboard(self)
+            super(Team, self).__setattr__(name, value)
+            registry.insert_in_leaderboard(self)
+        else:
+            super(Team, self).__setattr__(name, value)
+
+class Track(Watched):
+    displayed_attributes = ("artist", "title", "artist_revealed", "title_revealed", "artist_found_by", "title_found_by")
 
-class Track:
-    def __init__(self, artist="ARTIST", title="TITLE", media=None, cover=None):
+    def __init__(self, artist="ARTIST", title="TITLE", audio_file=None, cover_file=None):
         self.artist = artist
         self.title = title
-        self.media = media
-        self.cover = cover
+        self.audio_file = audio_file
+        self.cover_file = cover_file
+        self.audio_hash = None
+        self.store = None
+        self.gain = 1
+        self.hooks = []
         self.artist_revealed = False
         self.title_revealed = False
         self.artist_found_by = None
         self.title_found_by = None
 
+    @property
+    def media(self):
+        return self.store.get_media(self)
+
+    @property
+    def cover(self):
+        return self.store.get_cover(self)
+
+# Chargement des pistes
+#######################
+
+def default_cover_size(page_size):
+    # taille d'une pochette sur le plus grand écran branché, l'afficheur en plein écran
+    try:
+        height = max(screen.height for screen in pg.canvas.get_display().get_screens())
+    except Exception: # pas d'écran accessible
+        height = DISPLAY_WINDOW_HEIGHT
+    return min(int(height * COVER_HEIGHT_RATIO), page_size - COVER_ATLAS_PADDING)
+
+def atlas_page_size():
+    # la plus grande texture qu'accepte la carte graphique (contexte OpenGL requis), bornée
+    max_size = pg.gl.GLint()
+    pg.gl.glGetIntegerv(pg.gl.GL_MAX_TEXTURE_SIZE, max_size)
+    return min(max_size.value, COVER_ATLAS_MAX_PAGE_SIZE)
+
+def resize_pixels(pixels, new_height, new_width):
+    # mise à l'échelle bilinéaire d'une image RGBA (hauteur, largeur, 4)
+    height, width = pixels.shape[:2]
+    ys = np.clip((np.arange(new_height) + 0.5) * height / new_height - 0.5, 0, height - 1)
+    xs = np.clip((np.arange(new_width) + 0.5) * width / new_width - 0.5, 0, width - 1)
+    y0, x0 = ys.astype(int), xs.astype(int)
+    y1, x1 = np.minimum(y0 + 1, height - 1), np.minimum(x0 + 1, width - 1)
+    wy, wx = (ys - y0)[:, None, None], (xs - x0)[None, :, None]
+    pixels = pixels.astype(np.float32)
+    top = pixels[y0][:, x0] * (1 - wx) + pixels[y0][:, x1] * wx
+    bottom = pixels[y1][:, x0] * (1 - wx) + pixels[y1][:, x1] * wx
+    return np.round(top * (1 - wy) + bottom * wy).astype(np.uint8)
+
+def scale_pixels(pixels, size):
+    # l'image entière, proportions gardées, centrée dans un carré de côté size
+    height, width = pixels.shape[:2]
+    factor = size / max(height, width)
+    new_height, new_width = max(1, round(height * factor)), max(1, round(width * factor))
+    scaled = np.zeros((size, size, 4), dtype=np.uint8)
+    top_offset, left_offset = (size - new_height) // 2, (size - new_width) // 2
+    scaled[top_offset:top_offset+new_height, left_offset:left_offset+new_width] = \
+        resize_pixels(pixels, new_height, new_width)
+    return scaled
+
+class CoverAtlas:
+    # Pochettes mises à la taille de l'afficheur et rangées dans des pages de texture, aussi grandes que la carte
+    # graphique le permet. Les pages sont construites dans un thread et gardées sur disque, compressées, d'une
+    # partie à l'autre. Révéler une pochette revient à prendre une région d'une page.
+    def __init__(self, cover_files, size, page_size, directory=COVER_ATLAS_DIR, owner=None):
+        if not 0 < size <= page_size - COVER_ATLAS_PADDING:
+            raise ValueError(f"taille de pochette hors de l'atlas : {size} (1 à {page_size - COVER_ATLAS_PADDING})")
+        self.cover_files = cover_files # dans l'ordre de la playlist
+        self.size = size
+        self.page_size = page_size
+        self.stride = size + COVER_ATLAS_PADDING
+        self.columns = page_size // self.stride
+        self.per_page = self.columns ** 2
+        self.directory = directory
+        self.owner = owner # playlist à laquelle appartiennent les pages, pour n'élaguer que les siennes
+        os.makedirs(directory, exist_ok=True)
+        page_count = (len(cover_files) + self.per_page - 1) // self.per_page
+        self.paths = [None] * page_count
+        self.ready = [threading.Event() for _ in range(page_count)]
+        self.textures = OrderedDict()
+        self._staged = {} # page -> pixels décompressés par le thread, prêts pour le GPU
+        self._wanted = []
+        self._pruned = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    def close(self):
+        # atlas remplacé (playlist rechargée) : le thread s'arrête après la page en cours, et les textures sont
+        # libérées par pyglet quand plus rien ne les désigne (une région encore affichée garde sa page)
+        with self._lock:
+            self._closed = True
+            self._staged.clear()
+            self._wakeup.notify()
+        self.textures.clear()
+
+    def page_files(self, page):
+        return self.cover_files[page*self.per_page:(page+1)*self.per_page]
+
+    def page_path(self, page):
+        # une page est reconstruite dès qu'une de ses pochettes, la taille ou celle des pages change
+        key = hashlib.sha1(f"{self.size} {self.page_size}".encode())
+        for cover_file in self.page_files(page):
+            stat_result = os.stat(cover_file) if os.path.isfile(cover_file) else None
+            key.update(repr((cover_file, stat_result and stat_result.st_mtime_ns, stat_result and stat_result.st_size))
+                       .encode())
+        return os.path.join(self.directory, f"{key.hexdigest()}.npz")
+
+    def region(self, index):
+        # None si la page n'est pas (encore) disponible : la pochette est alors chargée seule
+        page, slot = divmod(index, self.per_page)
+        if not self.paths[page]:
+            return None
+        row, column = divmod(slot, self.columns)
+        return self._texture(page).get_region(column*self.stride, row*self.stride, self.size, self.size)
+
+    def prefetch(self, index):
+        # la page demandée passe en tête : construite, décompressée, puis envoyée au GPU dès qu'elle est prête
+        page = index // self.per_page
+        if page >= len(self.paths):
+            return
+        with self._lock:
+            self._wanted = [page]
+            self._staged = {other: pixels for other, pixels in self._staged.items() if other == page}
+            self._wakeup.notify()
+        if page not in self.textures:
+            def upload(dt):
+                if self._closed or page in self.textures:
+                    return
+                if page in self._staged:
+                    self._texture(page)
+                elif self._wanted == [page] and not (self.ready[page].is_set() and not self.paths[page]):
+                    pg.clock.schedule_once(upload, 0.1)
+            pg.clock.schedule_once(upload, 0)
+
+    def _texture(self, page):
+        # dans le thread principal uniquement, pour une page prête
+        if page in self.textures:
+            self.textures.move_to_end(page)
+            return self.textures[page]
+        with self._lock:
+            pixels = self._staged.pop(page, None)
+        if pixels is None: # pas encore préparée par le thread : décompressée ici
+            pixels = self._read(page)
+        image = pg.image.ImageData(pixels.shape[1], pixels.shape[0], "RGBA", pixels.tobytes())
+        self.textures[page] = image.get_texture()
+        while len(self.textures) > COVER_ATLAS_RESIDENT_PAGES:
+            self.textures.popitem(last=False)
+        return self.textures[page]
+
+    def _read(self, page):
+        with np.load(self.paths[page]) as archive:
+            return archive["pixels"]
+
+    def _build(self, page):
+        path = self.page_path(page)
+        pixels = None
+        if not os.path.isfile(path):
+            rows = (len(self.page_files(page)) + self.columns - 1) // self.columns
+            pixels = np.zeros((rows*self.stride, self.columns*self.stride, 4), dtype=np.uint8)
+            for slot, cover_file in enumerate(self.page_files(page)):
+                row, column = divmod(slot, self.columns)
+                try:
+                    image = pg.image.load(cover_file).get_image_data()
+                except Exception as e:
+                    print(f"Pochette illisible ({cover_file}) : {e}")
+                    continue
+                cover = np.frombuffer(image.get_data("RGBA", image.width*4), dtype=np.uint8)
+                cover = cover.reshape(image.height, image.width, 4)
+                pixels[row*self.stride:row*self.stride+self.size,
+                       column*self.stride:column*self.stride+self.size] = scale_pixels(cover, self.size)
+            temp_path = f"{path}.tmp.npz"
+            np.savez_compressed(temp_path, pixels=pixels)
+            os.replace(temp_path, path) # atomique : une autre partie ne lit jamais une page à moitié écrite
+        with self._lock:
+            if pixels is not None and page in self._wanted: # déjà en mémoire : inutile de la relire
+                self._staged[page] = pixels
+            self.paths[page] = path
+        self.ready[page].set()
+
+    def _stage(self, page):
+        pixels = self._read(page)
+        with self._lock:
+            if page in self._wanted:
+                self._staged[page] = pixels
+
+    def prune(self):
+        # les pages que cette playlist ne désigne plus (pochettes ou taille changées) ne resserviront pas, sauf si
+        # une autre playlist les désigne encore : chacune tient la liste de ses pages dans un manifeste
+        if not self.owner:
+            return
+        manifests_dir = os.path.join(self.directory, "manifests")
+        os.makedirs(manifests_dir, exist_ok=True)
+        manifest = os.path.join(manifests_dir, f"{hashlib.sha1(os.path.abspath(self.owner).encode()).hexdigest()}.json")
+        current = sorted({os.path.basename(self.page_path(page)) for page in range(len(self.paths))})
+        previous, others = [], set()
+        for name in os.listdir(manifests_dir):
+            path = os.path.join(manifests_dir, name)
+            if not name.endswith(".json"):
+                continue
+            with open(path, "r") as f:
+                pages = json.load(f)
+            if path == manifest:
+                previous = pages
+            else:
+                others.update(pages)
+        for name in set(previous) - set(current) - others:
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                os.remove(path)
+        temp_path = f"{manifest}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(current, f)
+        os.replace(temp_path, manifest)
+
+    def _next_task(self):
+        # appelé avec le verrou : la page demandée d'abord, puis toutes les autres, puis l'élagage
+        for page in self._wanted:
+            if not self.ready[page].is_set():
+                return self._build, (page,)
+            if self.paths[page] and page not in self._staged and page not in self.textures:
+                return self._stage, (page,)
+        for page in range(len(self.paths)):
+            if not self.ready[page].is_set():
+                return self._build, (page,)
+        if not self._pruned:
+            self._pruned = True
+            return self.prune, ()
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not self._closed and not (task := self._next_task()):
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+            step, args = task
+            try:
+                step(*args)
+            except Exception as e:
+                if step == self._build:
+                    print(f"Page {args[0]+1} de l'atlas des pochettes impossible à construire : {e}")
+                    self.ready[args[0]].set() # sans chemin : ses pochettes seront chargées une à une
+                else:
+                    print(f"Atlas des pochettes : {e}")
+
+class TrackStore:
+    # Décode les pistes à la demande, précharge les voisines de la piste sélectionnée
+    # dans un thread, et oublie les moins récemment utilisées au-delà du budget mémoire.
+    def __init__(self, budget_bytes, prefetch_radius=DEFAULT_PREFETCH_RADIUS, pcm_cache=None):
+        self.tracks = []
+        self.budget_bytes = budget_bytes
+        self.prefetch_radius = prefetch_radius
+        self.pcm_cache = pcm_cache
+        self.atlas = None # CoverAtlas des pochettes, une fois toutes les pistes ajoutées
+        self._positions = {}
+        self._media = OrderedDict() # ordre LRU : le plus ancien en premier
+        self._sizes = {}
+        self._images = OrderedDict() # images de pochette décodées, pas encore envoyées au GPU
+        self._textures = OrderedDict()
+        self._loading = {}
+        self._wanted = []
+        self._generation = 0 # incrémentée à chaque remplacement de la liste des pistes
+        self._invalidated = {} # piste dont le fichier a changé -> génération du changement
+        self.load_times = deque(maxlen=METRICS_HISTORY) # lecture + décodage, dans n'importe quel thread
+        self.stall_times = deque(maxlen=METRICS_HISTORY) # attente du thread principal sur une piste pas prête
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker = threading.Thread(target=self._work, daemon=True)
+        self._worker.start()
+
+    @property
+    def resident_bytes(self):
+        return sum(self._sizes.values())
+
+    def add(self, track):
+        track.store = self
+        self._positions[track] = len(self.tracks)
+        self.tracks.append(track)
+
+    def replace(self, tracks, changed=()):
+        # nouvelle liste de pistes : les pistes gardées restent décodées, sauf celles dont le fichier a changé
+        kept = set(tracks) - set(changed)
+        with self._lock:
+            for cache in (self._media, self._sizes, self._images):
+                for track in [track for track in cache if track not in kept]:
+                    del cache[track]
+            self._wanted = [track for track in self._wanted if track in kept]
+            self.tracks = list(tracks)
+            self._positions = {track: idx for idx, track in enumerate(self.tracks)}
+            # un chargement en cours peut encore rapporter une piste retirée, ou l'ancien fichier d'une piste changée
+            self._generation += 1
+            self._invalidated = {track: generation for track, generation in self._invalidated.items()
+                                 if track in self._positions}
+            self._invalidated.update(dict.fromkeys(changed, self._generation))
+        for track in [track for track in self._textures if track not in kept]:
+            del self._textures[track]
+        for track in self.tracks:
+            track.store = self
+
+    def prefetch(self, center):
+        # ordre de priorité : la piste courante, puis les voisines en alternant suivante/précédente
+        wanted = [center]
+        for distance in range(1, self.prefetch_radius + 1):
+            wanted += [center + distance, center - distance]
+        with self._lock:
+            self._wanted = [self.tracks[i] for i in wanted if 0 <= i < len(self.tracks)]
+            self._wakeup.notify()
+        if self.atlas:
+            self.atlas.prefetch(center)
+
+    def get_media(self, track):
+        start = perf_counter()
+        for attempt in range(MEDIA_LOAD_ATTEMPTS):
+            with self._lock:
+                if track in self._media:
+                    self._media.move_to_end(track)
+                    if attempt:
+                        self.stall_times.append(perf_counter() - start)
+                    return self._media[track]
+                loading = self._loading.get(track)
+                owner = not loading
+                if owner:
+                    loading = self._loading[track] = threading.Event()
+            if not owner:
+                loading.wait() # chargement en cours dans le thread de préchargement : on relit son résultat
+                continue
+            # gardée ou aussitôt évincée, la piste chargée sert ; seul un fichier changé entre-temps fait recommencer
+            if (media := self._load(track, loading)) is not None:
+                self.stall_times.append(perf_counter() - start)
+                return media
+        raise RuntimeError(f"Piste impossible à charger : {track.artist} - {track.title}")
+
+    def get_cover(self, track):
+        if self.atlas and (region := self.atlas.region(self._positions[track])):
+            return region
+        if track in self._textures:
+            self._textures.move_to_end(track)
+            return self._textures[track]
+        with self._lock:
+            image = self._images.pop(track, None)
+        if not image:
+            image = pg.image.load(track.cover_file)
+        # l'envoi au GPU doit se faire dans le thread principal
+        self._textures[track] = image.get_texture()
+        while len(self._textures) > 2*self.prefetch_radius + 1:
+            self._textures.popitem(last=False)
+        return self._textures[track]
+
+    def _load(self, track, loading):
+        start = perf_counter()
+        with self._lock:
+            generation = self._generation
+        try:
+            if self.pcm_cache:
+                media = self.pcm_cache.load(track.audio_file, track.audio_hash)
+            else:
+                media = pg.media.load(track.audio_file, streaming=False)
+            image = None if self.atlas else pg.image.load(track.cover_file) # l'atlas a ses propres pochettes
+        except Exception:
+            with self._lock:
+                del self._loading[track]
+            loading.set()
+            raise
+        with self._lock:
+            stale = self._invalidated.get(track, 0) > generation # fichier changé pendant le chargement
+            if track in self._positions and not stale:
+                self._media[track] = media
+                # une piste projetée compte aussi : sa projection reste ouverte tant qu'elle est gardée
+                self._sizes[track] = int(media.duration * media.audio_format.bytes_per_second)
+                if image and track not in self._textures:
+                    self._images[track] = image
+                self._evict()
+            del self._loading[track]
+        self.load_times.append(perf_counter() - start)
+        loading.set()
+        return None if stale else media
+
+    def _evict(self):
+        # appelé avec le verrou ; ne libère jamais les pistes de la fenêtre de préchargement
+        while self.resident_bytes > self.budget_bytes:
+            victim = next((track for track in self._media if track not in self._wanted), None)
+            if not victim:
+                break
+            del self._media[victim]
+            del self._sizes[victim]
+            self._images.pop(victim, None)
+
+    def _next_wanted(self):
+        # appelé avec le verrou
+        for track in self._wanted:
+            if track in self._media or track in self._loading:
+                continue
+            evictable = any(other not in self._wanted for other in self._media)
+            if self.resident_bytes >= self.budget_bytes and not evictable:
+                return None
+            return track
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while not (track := self._next_wanted()):
+                    self._wakeup.wait()
+                loading = self._loading[track] = threading.Event()
+            try:
+                self._load(track, loading)
+            except Exception as e:
+                print(f"Préchargement impossible ({track.artist} - {track.title}) : {e}")
+                with self._lock:
+                    if track in self._wanted:
+                        self._wanted.remove(track)
+
+# Rechargement à chaud
+######################
+
+def apply_index_row(track, row):
+    # renvoie True si le fichier audio de la piste a changé
+    changed = track.audio_hash is not None and track.audio_hash != row["audio_hash"]
+    track.audio_file = row["audio_file"]
+    track.cover_file = row["cover_file"]
+    track.audio_hash = row["audio_hash"]
+    track.gain = 1 if row["loudness"] is None else min(1, 10 ** ((TARGET_LOUDNESS - row["loudness"]) / 20))
+    track.hooks = json.loads(row["hooks"])
+    return changed
+
+class PlaylistReloader(pg.event.EventDispatcher):
+    # Relit la playlist et les équipes en cours de partie (F5, ou dès qu'un des fichiers change avec --watch).
+    # L'index est mis à jour dans un thread, puis seules les différences sont fusionnées dans le thread principal :
+    # les pistes et équipes gardées restent les mêmes objets, avec leurs scores et ce qui a été trouvé.
+    def __init__(self, playlist_file, teams_file, index_file=INDEX_FILE, atlas_size=None):
+        self.playlist_file = playlist_file
+        self.teams_file = teams_file
+        self.index_file = index_file
+        self.atlas_size = atlas_size # None : pas d'atlas de pochettes
+        self.mtimes = self._mtimes()
+        self.running = False
+
+    def _mtimes(self):
+        return [os.stat(path).st_mtime if os.path.isfile(path) else None
+                for path in (self.playlist_file, self.teams_file)]
+
+    def check(self, dt):
+        if (mtimes := self._mtimes()) != self.mtimes:
+            self.mtimes = mtimes
+            self.reload()
+
+    def reload(self):
+        if self.running:
+            return
+        self.running = True
+        print("Rechargement de la playlist et des équipes...")
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def _work(self):
+        try:
+            with open(self.teams_file, "r") as f:
+                teams = [parse_team_line(line) for line in f.read().splitlines() if line.strip()]
+            analysis_index = AnalysisIndex()
+            track_index = TrackIndex(self.index_file) # sa propre connexion SQLite, dans ce thread
+            if not track_index.is_current(self.playlist_file):
+                track_index.build(self.playlist_file, analysis_index)
+            rows, missing = track_index.validate(analysis_index)
+            track_index.db.close()
+        except Exception as e:
+            print(f"Rechargement impossible : {e}")
+            self.running = False
+            return
+        for path in missing:
+            print(f"  Fichier manquant, piste ignorée : {path}")
+        rows = [row for row in rows if row["audio_file"] not in missing and row["cover_file"] not in missing]
+        pg.app.platform_event_loop.post_event(self, "on_reload_ready", rows, teams)
+
+    def on_reload_ready(self, rows, teams):
+        self.running = False
+        if not rows:
+            print("Playlist vide, rechargement ignoré.")
+            return
+        self.merge_tracks(rows)
+        self.merge_teams(teams)
+
+    def merge_tracks(self, rows):
+        selected = state.selected_track
+        existing = {(track.artist, track.title): track for track in state.tracks}
+        tracks, changed, added = [], [], 0
+        for row in rows:
+            if not (track := existing.pop((row["artist"], row["title"]), None)):
+                track = Track(row["artist"], row["title"])
+                added += 1
+            if apply_index_row(track, row):
+                changed.append(track)
+            tracks.append(track)
+        removed = len(existing)
+        if selected not in tracks and state.step != STEP_IDLE: # la piste en cours reste jusqu'à sa fin
+            tracks.insert(min(state.track_number, len(tracks)), selected)
+            removed -= 1
+
+        state.track_store.replace(tracks, changed)
+        if self.atlas_size:
+            if state.track_store.atlas:
+                state.track_store.atlas.close()
+            state.track_store.atlas = CoverAtlas([track.cover_file for track in tracks], self.atlas_size,
+                                                 atlas_page_size(), owner=self.playlist_file)
+            if state.display_window: # la pochette affichée vient de l'ancien atlas
+                state.display_window.layout_key = None
+                state.display_window.needs_redraw = True
+        state.track_number = tracks.index(selected) if selected in tracks else min(state.track_number, len(tracks) - 1)
+        state.track_store.prefetch(state.track_number)
+        print(f"Playlist rechargée : {added} pistes ajoutées, {removed} retirées, {len(changed)} modifiées.")
+
+    def merge_teams(self, teams):
+        # une ligne du fichier reprend l'équipe en jeu de même bouton, à défaut de même nom : renommée ou changée
+        # de bouton, elle garde son score (le score en jeu l'emporte sur le fichier)
+        by_button = {(team.device, team.button_id): team for team in state._teams}
+        matches = {}
+        for idx, team in enumerate(teams):
+            if kept := by_button.pop((team.device, team.button_id), None):
+                matches[idx] = kept
+        by_name = {team.name: team for team in by_button.values()}
+        for idx, team in enumerate(teams):
+            if idx not in matches and (kept := by_name.pop(team.name, None)):
+                matches[idx] = kept
+        merged = []
+        for idx, team in enumerate(teams):
+            if kept := matches.get(idx):
+                kept.name = team.name
+                kept.button_id, kept.device = team.button_id, team.device
+                merged.append(kept)
+            else:
+                merged.append(team)
+        removed = len(state._teams) - len(matches)
+        state.replace_teams(merged)
+        print(f"Équipes rechargées : {len(merged)} équipes, {removed} retirées.")
+
+PlaylistReloader.register_event_type("on_reload_ready")
+
+# Téléchargement
+################
+
+def http_session(pool_size=DEFAULT_DOWNLOAD_JOBS, retries=HTTP_RETRIES):
+    # une session partagée par les threads : connexions réutilisées, nouvelles tentatives sur les erreurs passagères
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size,
+                          pool_maxsize=pool_size,
+                          max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504)))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def youtube_search(query):
+    # premier résultat de la recherche, sans rien télécharger ni ouvrir la page de la vidéo
+    with youtube_dl.YoutubeDL({"quiet": True, "extract_flat": "in_playlist"}) as ydl:
+        info = ydl.extract_info(f"ytsearch1:{query}", download=False)
+    if not info.get("entries"):
+        return None
+    entry = info["entries"][0]
+    return {"video_id": entry["id"], "duration": entry.get("duration"), "title": entry.get("title")}
+
+def recorded_search(path):
+    # remplace youtube_search par des résultats enregistrés ({requête: résultat ou null}), pour tester sans réseau
+    with open(path, "r") as f:
+        results = json.load(f)
+    return results.get
+
+class SearchCache:
+    # Résultats des recherches (video_id, durée, titre), par piste. Un video_id ne change pas : pas d'expiration.
+    # Sans chemin, le cache ne vit qu'en mémoire.
+    def __init__(self, path=SEARCH_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if path:
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f)
+            except FileNotFoundError:
+                pass
+
+    def get(self, track):
+        return self.entries.get(track)
+
+    def update(self, track, **fields):
+        with self._lock:
+            self.entries.setdefault(track, {}).update(fields, searched=time())
+            self._save()
+
+    def remove(self, tracks):
+        with self._lock:
+            for track in tracks:
+                self.entries.pop(track, None)
+            self._save()
+
+    def _save(self):
+        # appelé avec le verrou
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+
+class SearchResolver:
+    # Trouve le video_id des lignes qui n'en ont pas, avant tout téléchargement et plusieurs recherches à la fois.
+    # search est n'importe quelle fonction requête -> {video_id, duration, title} ou None ; None : cache seul.
+    def __init__(self, search=youtube_search, cache=None, jobs=DEFAULT_RESOLVE_JOBS):
+        self.search = search
+        self.cache = cache if cache is not None else SearchCache()
+        self.jobs = jobs
+        self.searches = 0
+
+    def resolve(self, tracks, refresh=False):
+        # renvoie {piste: résultat}, None pour une piste sans résultat
+        resolved = {track: None if refresh else self.cache.get(track) for track in tracks}
+        missing = [track for track, entry in resolved.items() if not entry]
+        if missing and self.search:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                for track, entry in zip(missing, executor.map(self._search, missing)):
+                    resolved[track] = entry
+            self.searches += len(missing)
+        return resolved
+
+    def _search(self, track):
+        try:
+            entry = self.search(track)
+        except Exception as e:
+            print(f"[{track}] Recherche impossible : {e}")
+            return None
+        if entry:
+            self.cache.update(track, **entry)
+            return self.cache.get(track)
+        return None
+
+def write_back_video_ids(playlist_file, resolved):
+    # ajoute =video_id aux lignes qui n'en ont pas : les téléchargements suivants n'auront plus rien à chercher
+    with open(playlist_file, "r") as f:
+        lines = f.read().splitlines()
+    written = 0
+    for idx, line in enumerate(lines):
+        if line.strip() and "=" not in line and (entry := resolved.get(line.strip())):
+            lines[idx] = f"{line.strip()}={entry['video_id']}"
+            written += 1
+    temp_path = f"{playlist_file}.tmp"
+    with open(temp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(temp_path, playlist_file)
+    return written
+
+class CoverLookupCache:
+    # Résultats des recherches de pochettes, par piste : URL de l'image et son ETag, ou aucun résultat,
+    # avec la date de la recherche. Une entrée trop ancienne est ignorée, sauf hors ligne.
+    def __init__(self, path=COVER_LOOKUP_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def get(self, track, offline=False):
+        entry = self.entries.get(track)
+        if not entry:
+            return None
+        ttl = COVER_LOOKUP_TTL if entry["url"] else COVER_MISS_TTL
+        if offline or time() - entry["checked"] < ttl:
+            return entry
+        return None
+
+    def update(self, track, **fields):
+        with self._lock:
+            self.entries.setdefault(track, {}).update(fields)
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+class CoverFetcher:
+    # Recherche et télécharge les pochettes à travers une session partagée. Les recherches et les images sont
+    # gardées en cache : relancer `download` ne refait presque aucune requête. Hors ligne, seul le cache sert.
+    def __init__(self, session, lookup_cache, search_url=COVER_SEARCH_URL, offline=False,
+                 image_dir=COVER_IMAGE_CACHE_DIR):
+        self.session = session
+        self.lookup_cache = lookup_cache
+        self.search_url = search_url
+        self.offline = offline
+        self.image_dir = image_dir
+        os.makedirs(image_dir, exist_ok=True)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return self.session.get(url, timeout=HTTP_TIMEOUT, **kwargs)
+
+    def lookup(self, track):
+        if entry := self.lookup_cache.get(track, self.offline):
+            return entry
+        if self.offline:
+            raise RuntimeError("hors ligne, et aucune recherche en cache")
+        response = self.get(self.search_url, params={"term": track, "media": "music", "entity": "album", "limit": 1})
+        response.raise_for_status()
+        results = response.json().get("results", [])
+        url = results[0]["artworkUrl100"].replace("100x100", f"{COVER_SIZE}x{COVER_SIZE}") if results else None
+        self.lookup_cache.update(track, url=url, checked=time())
+        return self.lookup_cache.get(track, offline=True)
+
+    def image(self, track, entry):
+        # l'image en cache, revalidée par son ETag une fois trop ancienne
+        path = os.path.join(self.image_dir, f"{hashlib.sha1(entry['url'].encode()).hexdigest()}.jpg")
+        cached = os.path.isfile(path)
+        if cached and (self.offline or time() - entry.get("fetched", 0) < COVER_LOOKUP_TTL):
+            return path
+        if self.offline:
+            raise RuntimeError("hors ligne, et image absente du cache")
+        headers = {"If-None-Match": entry["etag"]} if cached and entry.get("etag") else {}
+        response = self.get(entry["url"], headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(response.content)
+            os.replace(temp_path, path)
+        self.lookup_cache.update(track, etag=response.headers.get("ETag", entry.get("etag")), fetched=time())
+        return path
+
+    def fetch(self, track, work_dir):
+        cover_file = os.path.join(COVERS_DIR, f"{track}.jpg")
+        entry = self.lookup(track)
+        if not entry["url"]:
+            os.symlink(os.path.join(BASE_DIR, IMAGES_DIR, NOCOVER_IMAGE), cover_file)
+            print(f"[{track}] Couverture introuvable, lien symbolique créé vers couverture générique.")
+            return
+        temp_cover_file = os.path.join(work_dir, "cover.jpg")
+        shutil.copyfile(self.image(track, entry), temp_cover_file)
+        shutil.move(temp_cover_file, cover_file)
+        print(f"[{track}] Couverture téléchargée.")
+
+class DownloadTask:
+    def __init__(self, line):
+        self.track, self.video_id = parse_playlist_line(line)
+        self.work_dir = None
+        self.audio_file = None
+        self.error = None
+        self.timings = {}
+
+class DownloadPipeline:
+    # Trois étages (téléchargement, suppression des silences, pochette) reliés par des files bornées,
+    # chacun avec ses propres threads. Chaque tâche travaille dans son propre dossier temporaire.
+    def __init__(self, jobs=DEFAULT_DOWNLOAD_JOBS, retries=DEFAULT_DOWNLOAD_RETRIES,
+                 codec=DEFAULT_AUDIO_CODEC, bitrate=DEFAULT_AUDIO_BITRATE,
+                 offline=False, cover_search_url=COVER_SEARCH_URL):
+        self.jobs = jobs
+        self.retries = 0 if offline else retries # hors ligne, réessayer ne changerait rien
+        self.codec = codec
+        self.bitrate = bitrate
+        self.offline = offline
+        self.cover_fetcher = CoverFetcher(http_session(jobs), CoverLookupCache(), cover_search_url, offline)
+        self.stages = [(self.fetch, queue.Queue(maxsize=jobs)),
+                       (self.ingest, queue.Queue(maxsize=jobs)),
+                       (self.cover, queue.Queue(maxsize=jobs))]
+        self.done = []
+        self.analysis_index = AnalysisIndex()
+        self.store = BlobStore()
+        self.resolver = SearchResolver(None if offline else youtube_search, jobs=max(jobs, DEFAULT_RESOLVE_JOBS))
+
+    def fetch(self, task):
+        if os.path.isfile(find_track_file(task.track)):
+            self.store.adopt(task.track, task.video_id)
+            print(f"[{task.track}] Le fichier audio existe déjà, ignore.")
+            return
+        if blob := self.store.blob_for(task.track, task.video_id):
+            self.relink(task.track, blob, task.video_id)
+            return
+        if self.offline:
+            raise RuntimeError("hors ligne, et fichier audio absent")
+        start = time()
+        task.audio_file, video_id = fetch_audio(task.track, task.video_id, task.work_dir,
+                                                skip=lambda video_id: self.store.blob_for(video_id=video_id))
+        task.timings["fetch"] = time() - start
+        if not task.video_id: # la recherche a eu lieu ici faute d'avoir abouti avant
+            self.resolver.cache.update(task.track, video_id=video_id)
+        if not task.audio_file: # trouvée par la recherche, mais déjà dans le stock
+            self.relink(task.track, self.store.blob_for(video_id=video_id), video_id)
+        else:
+            task.video_id = video_id
+
+    def relink(self, track, blob, video_id):
+        # nouveau nom pour un son déjà stocké : l'analyse suit, rien n'est retéléchargé ni réencodé
+        previous = next((name for name in self.store.names_for(blob) if self.analysis_index.get(name)), None)
+        self.store.link(track, blob, video_id)
+        if previous and previous != track:
+            self.analysis_index.update(track, self.analysis_index.get(previous))
+        print(f"[{track}] Déjà dans le stock, lien refait.")
+
+    def ingest(self, task):
+        if task.audio_file:
+            output_file, analysis = ingest_audio(task.track, task.audio_file, task.work_dir,
+                                                 self.codec, self.bitrate, task.timings)
+            # rangé seulement une fois complet, pour qu'une piste interrompue ne passe pas pour téléchargée
+            self.store.add(task.track, output_file, task.video_id)
+            self.analysis_index.update(task.track, analysis)
+
+    def cover(self, task):
+        if os.path.lexists(os.path.join(COVERS_DIR, f"{task.track}.jpg")):
+            print(f"[{task.track}] La pochette existe déjà, ignore.")
+            return
+        start = time()
+        self.cover_fetcher.fetch(task.track, task.work_dir)
+        task.timings["cover"] = time() - start
+
+    def run(self, lines):
+        workers = []
+        for idx, (step, inbox) in enumerate(self.stages):
+            outbox = self.stages[idx+1][1] if idx+1 < len(self.stages) else None
+            stage_workers = [threading.Thread(target=self._work, args=(step, inbox, outbox), daemon=True)
+                             for _ in range(self.jobs)]
+            for worker in stage_workers:
+                worker.start()
+            workers.append(stage_workers)
+
+        # toutes les recherches d'abord, en parallèle et depuis le cache si possible
+        tasks = [DownloadTask(line) for line in lines]
+        resolved = self.resolver.resolve([task.track for task in tasks if not task.video_id])
+        for task in tasks:
+            if not task.video_id and resolved[task.track]:
+                task.video_id = resolved[task.track]["video_id"]
+
+        for task in tasks:
+            task.work_dir = tempfile.mkdtemp(prefix="blind-")
+            print(f"Démarre '{task.track}' ({task.video_id if task.video_id else 'pas de video_id'})...")
+            self.stages[0][1].put(task)
+
+        # arrêt étage par étage : un étage ne se termine qu'une fois le précédent vidé
+        for (_, inbox), stage_workers in zip(self.stages, workers):
+            for _ in stage_workers:
+                inbox.put(None)
+            for worker in stage_workers:
+                worker.join()
+
+        return self.done
+
+    def _work(self, step, inbox, outbox):
+        while (task := inbox.get()) is not None:
+            if not task.error: # une tâche qui a échoué à un étage traverse les suivants sans rien faire
+                for attempt in range(self.retries + 1):
+                    try:
+                        step(task)
+                        task.error = None
+                        break
+                    except Exception as e:
+                        task.error = f"{step.__name__} : {e}"
+                        print(f"[{task.track}] Échec ({task.error}), essai {attempt+1}/{self.retries+1}")
+                        if attempt < self.retries:
+                            sleep(2 ** attempt)
+            if outbox:
+                outbox.put(task)
+            else:
+                shutil.rmtree(task.work_dir, ignore_errors=True)
+                self.done.append(task)
+
+# Banc d'essai
+##############
+
+def render_lavfi(source, output_file, *options):
+    # génère une image, un son ou une animation de test avec les sources synthétiques de FFmpeg
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-f", "lavfi", "-i", source, *options, output_file], check=True)
+
+def create_bench_fixtures(directory, track_count, gif_count, track_duration):
+    # une partie complète dans directory : playlist, équipes, pistes (sons purs), pochettes, GIF et ressources
+    for subdirectory in (TRACKS_DIR, COVERS_DIR, FX_DIR, GIFS_DIR, IMAGES_DIR):
+        os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+
+    tracks = [f"Artiste {idx+1} - Titre {idx+1}" for idx in range(track_count)]
+    for idx, track in enumerate(tracks):
+        render_lavfi(f"sine=frequency={220 + 10*idx}:sample_rate=44100:duration={track_duration}",
+                     os.path.join(directory, TRACKS_DIR, f"{track}.mp3"), "-ac", "2")
+        render_lavfi(f"color=c=0x{random.randrange(0x1000000):06X}:s=600x600",
+                     os.path.join(directory, COVERS_DIR, f"{track}.jpg"), "-frames:v", "1")
+    for idx in range(gif_count):
+        render_lavfi("testsrc=size=320x240:rate=10", os.path.join(directory, GIFS_DIR, f"bench{idx+1}.gif"), "-t", "2")
+
+    render_lavfi("sine=frequency=880:duration=0.3", os.path.join(directory, FX_DIR, BUZZER_FX))
+    render_lavfi("sine=frequency=660:duration=0.5", os.path.join(directory, FX_DIR, SUCCESS_FX))
+    render_lavfi(f"color=c=0x202020:s={DISPLAY_WINDOW_WIDTH}x{DISPLAY_WINDOW_HEIGHT}",
+                 os.path.join(directory, IMAGES_DIR, BACKGROUND_IMAGE), "-frames:v", "1")
+    for image in (NEUTRAL_IMAGE, BUZZER_IMAGE, NOCOVER_IMAGE):
+        render_lavfi("color=c=0x808080:s=400x400", os.path.join(directory, IMAGES_DIR, image), "-frames:v", "1")
+
+    with open(os.path.join(directory, "playlist.txt"), "w") as f:
+        f.write("\n".join(tracks) + "\n")
+    with open(os.path.join(directory, "teams.txt"), "w") as f:
+        f.write("".join(f"Équipe {idx+1}:{idx}:0\n" for idx in range(BENCH_TEAMS)))
+
+class BenchScript:
+    # Partie jouée toute seule dans le sous-processus lancé par `bench` : lance les pistes, buzze par le tube evdev,
+    # reprend, passe à la piste suivante... puis écrit ses mesures et quitte.
+    def __init__(self, path, duration):
+        self.path = path
+        self.duration = duration
+        self.first_frames = {}
+        self.buzz_to_frame = deque(maxlen=METRICS_HISTORY)
+        self.pressed_at = None
+        self.device = FakeEvdevDevice(path=state.evdev_devices[0])
+        self.tracks_played = 0
+        self.buzzes = 0
+        self.track_buzzes = 0
+        self.ending = False
+
+    def start(self):
+        for window in (window for window in (state.control_window, state.display_window) if window):
+            window.push_handlers(on_draw=functools.partial(self.on_draw, window))
+        pg.clock.schedule_interval(self.step, BENCH_STEP_INTERVAL)
+        pg.clock.schedule_once(self.finish, self.duration)
+
+    def on_draw(self, window):
+        now = time()
+        self.first_frames.setdefault(window.frame_timer.name, now)
+        if window is state.display_window and self.pressed_at and state.step == STEP_ANSWERING:
+            self.buzz_to_frame.append(now - self.pressed_at)
+            self.pressed_at = None
+
+    def press_key(self, symbol):
+        state.control_window.dispatch_event("on_key_press", symbol, 0)
+
+    def step(self, dt):
+        if state.step == STEP_IDLE and not state.player:
+            if self.tracks_played:
+                state.shift_selected_track(1 if state.track_number < len(state.tracks) - 1 else -state.track_number)
+            self.press_key(pg.window.key.ENTER)
+            self.tracks_played += 1
+            self.track_buzzes = 0
+            self.ending = False
+        elif state.step == STEP_PLAYING and not self.ending:
+            if self.track_buzzes < BENCH_BUZZES_PER_TRACK:
+                if team := next((team for team in state.teams if team.can_buzz), None):
+                    self.pressed_at = time()
+                    self.device.press(team.button_id, self.pressed_at)
+                    self.track_buzzes += 1
+                    self.buzzes += 1
+            else:
+                self.ending = True # Entrée pendant le fondu le relancerait
+                self.press_key(pg.window.key.ENTER)
+        elif state.step == STEP_ANSWERING:
+            self.press_key(pg.window.key.ENTER)
+
+    def finish(self, dt):
+        pg.clock.unschedule(self.step)
+        results = {"first_frames": self.first_frames,
+                   "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                   "tracks_played": self.tracks_played,
+                   "buzzes": self.buzzes,
+                   "buzz_to_frame": summarize_durations(self.buzz_to_frame),
+                   "metrics": state.metrics.snapshot()}
+        with open(self.path, "w") as f:
+            json.dump(results, f)
+        self.device.close()
+        pg.app.exit()
+
 # Sous-commandes, options et paramètres
 #######################################
 
@@ -732,58 +3367,236 @@ class Track:
 def cli():
     pass
 
+def download_options(command):
+    # options communes à `download` et `sync`
+    options = [
+        click.option("--playlist-file", type=click.Path(exists=True), default="playlist.txt", help="Playlist file."),
+        click.option("--jobs",
+                     type=int,
+                     default=DEFAULT_DOWNLOAD_JOBS,
+                     help="How many tracks are processed at the same time, at each stage."),
+        click.option("--retries",
+                     type=int,
+                     default=DEFAULT_DOWNLOAD_RETRIES,
+                     help="How many times a failed step is retried before giving up on the track."),
+        click.option("--codec",
+                     type=click.Choice(list(AUDIO_CODECS)),
+                     default=DEFAULT_AUDIO_CODEC,
+                     help="Codec of newly stored tracks."),
+        click.option("--bitrate",
+                     default=DEFAULT_AUDIO_BITRATE,
+                     help="Bitrate of newly stored tracks (ignored for flac)."),
+        click.option("--offline",
+                     is_flag=True,
+                     help="Make no network request: covers come from the lookup cache only, songs to download fail."),
+        click.option("--cover-search-url",
+                     default=COVER_SEARCH_URL,
+                     help="iTunes-compatible search endpoint used to find covers (e.g. a local stub server, for tests)."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+def report_failures(tasks):
+    # liste les pistes en échec, et fait échouer la commande s'il y en a
+    failed = [task for task in tasks if task.error]
+    if failed:
+        print("Échecs :")
+        for task in failed:
+            print(f"  {task.track} ({task.error})")
+        sys.exit(1)
+
 @cli.command()
-@click.option("--playlist-file", type=click.Path(exists=True), default="playlist.txt", help="Playlist file.")
-def download(playlist_file):
+@download_options
+def download(playlist_file, jobs, retries, codec, bitrate, offline, cover_search_url):
     """Download songs and cover pictures."""
     with open(playlist_file, "r") as f:
-        lines = f.read().splitlines()
+        lines = [line.strip() for line in f.read().splitlines() if line.strip()]
+
+    start = time()
+    pipeline = DownloadPipeline(jobs, retries, codec, bitrate, offline, cover_search_url)
+    tasks = pipeline.run(lines)
+    failed = [task for task in tasks if task.error]
+
+    print(f"{len(tasks) - len(failed)}/{len(tasks)} pistes traitées en {time() - start:.0f} s.")
+    print(f"Recherches : {pipeline.resolver.searches} requêtes réseau.")
+    print(f"Pochettes : {pipeline.cover_fetcher.requests} requêtes réseau.")
+    for stage in ("fetch", "decode", "trim", "analyze", "encode", "cover"):
+        durations = [task.timings[stage] for task in tasks if stage in task.timings]
+        if durations:
+            print(f"  {stage:<7}: {sum(durations):7.1f} s au total, {sum(durations)/len(durations):5.2f} s par piste")
+    report_failures(tasks)
 
-    for line in lines:
-        line = line.strip()
-        if "=" in line:
-            track, video_id = line.split("=")
-        else:
-            track = line
-            video_id = None
+@cli.command()
+@download_options
+@click.option("--dry-run", is_flag=True, help="Only show what would change.")
+def sync(playlist_file, jobs, retries, codec, bitrate, offline, cover_search_url, dry_run):
+    """Bring the track store in line with the playlist, fetching only new songs, then drop unreferenced audio."""
+    with open(playlist_file, "r") as f:
+        lines = [line.strip() for line in f.read().splitlines() if line.strip()]
+
+    store = BlobStore()
+    changes = store.diff([parse_playlist_line(line) for line in lines])
+    print(f"{len(changes['unchanged'])} pistes inchangées, {len(changes['adopt'])} à ranger dans le stock, "
+          f"{len(changes['relink'])} renommées, {len(changes['new'])} nouvelles, {len(changes['removed'])} retirées.")
+    for kind, label in (("adopt", "="), ("relink", "~"), ("new", "+"), ("removed", "-")):
+        for track in changes[kind]:
+            print(f"  {label} {track}")
+    if dry_run:
+        return
+
+    pipeline = DownloadPipeline(jobs, retries, codec, bitrate, offline, cover_search_url)
+    pipeline.store = store
+    tasks = pipeline.run(lines)
+
+    # les lignes de l'index SQLite suivent la playlist : elles disparaissent à sa prochaine reconstruction
+    for track in changes["removed"]:
+        store.unlink(track)
+    pipeline.analysis_index.remove(changes["removed"])
+    pipeline.resolver.cache.remove(changes["removed"])
+    removed, freed = store.garbage_collect()
+    print(f"{removed} fichiers audio supprimés du stock ({freed / 1024**2:.1f} Mio libérés).")
+
+    report_failures(tasks)
 
-        print(f"Démarre '{track}' ({video_id if video_id else 'pas de video_id'})...")
+@cli.command()
+@click.option("--playlist-file", type=click.Path(exists=True), default="playlist.txt", help="Playlist file.")
+@click.option("--jobs", type=int, default=DEFAULT_RESOLVE_JOBS, help="How many searches run at the same time.")
+@click.option("--write-back", is_flag=True, help="Append the found video IDs to the playlist lines (track=video_id).")
+@click.option("--refresh", is_flag=True, help="Search again even for tracks found in the search cache.")
+@click.option("--recorded-searches",
+              type=click.Path(exists=True),
+              help="JSON file of recorded results ({query: result or null}), used instead of searching online.")
+def resolve(playlist_file, jobs, write_back, refresh, recorded_searches):
+    """Find the video ID of every track without one, without downloading anything."""
+    with open(playlist_file, "r") as f:
+        entries = [parse_playlist_line(line) for line in f.read().splitlines() if line.strip()]
+    tracks = [track for track, video_id in entries if not video_id]
 
-        if not os.path.isfile(os.path.join(TRACKS_DIR, f"{track}.mp3")):
-            download_audio(track=track, video_id=video_id)
+    start = time()
+    if recorded_searches:
+        # cache en mémoire : les résultats enregistrés ne se mêlent pas au vrai cache, et sont tous rejoués
+        resolver = SearchResolver(recorded_search(recorded_searches), cache=SearchCache(path=None), jobs=jobs)
+    else:
+        resolver = SearchResolver(youtube_search, jobs=jobs)
+    resolved = resolver.resolve(tracks, refresh)
+    for track in tracks:
+        if entry := resolved[track]:
+            seconds = int(entry.get("duration") or 0) # flottant, ou absente, dans les résultats à plat
+            duration = f"{seconds // 60}:{seconds % 60:02}" if seconds else "?"
+            print(f"  {track} -> {entry['video_id']} ({entry.get('title')}, {duration})")
         else:
-            print(f"Le fichier audio existe déjà, ignore.")
+            print(f"  {track} -> aucun résultat")
 
-        if not os.path.isfile(os.path.join(COVERS_DIR, f"{track}.jpg")):
-            download_cover(track)
-        else:
-            print(f"La pochette existe déjà, ignore.")
+    found = sum(1 for entry in resolved.values() if entry)
+    print(f"{found}/{len(tracks)} pistes résolues en {time() - start:.1f} s, {resolver.searches} recherches.")
+    if write_back:
+        print(f"{write_back_video_ids(playlist_file, resolved)} lignes complétées dans {playlist_file}.")
 
 @cli.command()
-def check():
-    """Discover what button triggers what code, visually."""
-    button_check_window = ButtonCheckWindow()
+@click.option("--playlist-file", type=click.Path(exists=True), default="playlist.txt", help="Playlist file.")
+@click.option("--jobs",
+              type=int,
+              default=DEFAULT_DOWNLOAD_JOBS,
+              help="How many tracks are analyzed at the same time.")
+@click.option("--force", is_flag=True, help="Analyze tracks again even if they already have results.")
+def analyze(playlist_file, jobs, force):
+    """Measure loudness and find hook points of downloaded tracks."""
+    with open(playlist_file, "r") as f:
+        tracks = [parse_playlist_line(line)[0] for line in f.read().splitlines() if line.strip()]
+
+    analysis_index = AnalysisIndex()
+    if not force:
+        tracks = [track for track in tracks if not analysis_index.get(track)]
+
+    def analyze_track(track):
+        try:
+            analysis = analyze_samples(decode_audio(find_track_file(track)))
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"[{track}] Analyse impossible : {e}")
+            return
+        analysis_index.update(track, analysis)
+        print(f"[{track}] {analysis['loudness']} dB, accroches : {analysis['hooks']}")
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        list(executor.map(analyze_track, tracks))
 
-    @state.joystick.event
-    def on_joybutton_press(joystick, button):
+    print(f"{len(tracks)} pistes analysées.")
+
+@cli.command("build-index")
+@click.option("--playlist-file", type=click.Path(exists=True), default="playlist.txt", help="Playlist file.")
+@click.option("--index-file", default=INDEX_FILE, help="Track index to write.")
+def build_index(playlist_file, index_file):
+    """Build the track index read by play."""
+    start = time()
+    rows = TrackIndex(index_file).build(playlist_file, AnalysisIndex())
+    missing = [row["name"] for row in rows if not (os.path.isfile(row["audio_file"]) and os.path.isfile(row["cover_file"]))]
+    print(f"{len(rows)} pistes indexées en {time() - start:.1f} s.")
+    if missing:
+        print("Pistes incomplètes (audio ou pochette manquant) :")
+        for name in missing:
+            print(f"  {name}")
+        sys.exit(1)
+
+@cli.command()
+@click.option("--latency",
+              is_flag=True,
+              help=f"Measure press-to-pixel latency per button, print percentiles every {LATENCY_REPORT_INTERVAL} "
+                   "seconds and export every press to a CSV file on exit.")
+@click.option("--latency-file", default="latency.csv", help="CSV file written by --latency.")
+@click.option("--input-backend",
+              type=click.Choice(["pyglet", "evdev"]),
+              default=DEFAULT_INPUT_BACKEND,
+              help="How buttons are read (see play).")
+@click.option("--evdev-device",
+              multiple=True,
+              help="With --input-backend evdev, use these event devices (or test pipes) instead of detected joysticks.")
+def check(latency, latency_file, input_backend, evdev_device):
+    """Discover what button triggers what code, visually."""
+    state.input_backend = "evdev" if evdev_device else input_backend
+    state.evdev_devices = evdev_device
+    latency_probe = LatencyProbe() if latency else None
+    button_check_window = ButtonCheckWindow(latency_probe)
+    # la boucle du jeu : un appui est dessiné au passage suivant, pas au prochain tic de l'horloge
+    pg.app.event_loop = event_loop = RedrawEventLoop()
+
+    @state.buzzers.event
+    def on_buzzer_press(device, button, timestamp):
         # ici : convertir évent. le code reçu
+        if latency_probe:
+            latency_probe.arrived(device, button, timestamp)
+        else:
+            print(f"Boîtier {device}, bouton {button}")
         try:
             button_check_window.button_labels[button].color = (255, 0, 0, 255)
         except IndexError:
             pass
-        button_check_window.dispatch_event("on_draw")
+        # redessinée par la boucle, à l'image qu'elle envoie vraiment à l'écran : c'est elle que mesure la sonde
+        event_loop.invalidate(button_check_window)
 
-    @state.joystick.event
-    def on_joybutton_release(joystick, button):
+    @state.buzzers.event
+    def on_buzzer_release(device, button):
         # ici : convertir évent. le code reçu
         try:
             button_check_window.button_labels[button].color = (255, 255, 255, 255)
         except IndexError:
             pass
-        button_check_window.dispatch_event("on_draw")
+        event_loop.invalidate(button_check_window)
+
+    if latency_probe:
+        def print_latency(dt):
+            for line in latency_probe.report():
+                print(line)
+        pg.clock.schedule_interval(print_latency, LATENCY_REPORT_INTERVAL)
 
     pg.app.run()
 
+    if latency_probe:
+        for line in latency_probe.report():
+            print(line)
+        latency_probe.export(latency_file)
+        print(f"{len(latency_probe.rows)} appuis exportés dans {latency_file}")
+
 @cli.command()
 @click.option("--playlist-file",
               type=click.Path(exists=True),
@@ -813,13 +3626,139 @@ def check():
               type=float,
               default=DEFAULT_FADEOUT_FACTOR,
               help="Between 0 and 1, higher = longer fadeout, 0 = no fadeout.")
+@click.option("--audio-cache-mb",
+              type=int,
+              default=DEFAULT_AUDIO_CACHE_MB,
+              help="Memory budget for decoded tracks (in MB), mapped cache files included. "
+                   "Least recently used tracks are dropped beyond it.")
+@click.option("--prefetch-radius",
+              type=int,
+              default=DEFAULT_PREFETCH_RADIUS,
+              help="How many tracks before and after the selected one are decoded in the background.")
+@click.option("--pcm-cache-mb",
+              type=int,
+              default=DEFAULT_PCM_CACHE_MB,
+              help="Size cap of the on-disk cache of decoded tracks (in MB). 0 disables the cache.")
+@click.option("--index-file",
+              default=INDEX_FILE,
+              help="Track index built by build-index. Rebuilt automatically if the playlist changed.")
+@click.option("--frame-stats",
+              is_flag=True,
+              help=f"Print frame times of both windows every {FRAME_STATS_INTERVAL} seconds.")
+@click.option("--legacy-redraw",
+              is_flag=True,
+              help="Use pyglet's default loop, which redraws both windows after every event.")
+@click.option("--idle-benchmark",
+              type=float,
+              default=None,
+              help="Leave the game idle for this many seconds, print the CPU time used and the frames drawn, then quit.")
+@click.option("--input-backend",
+              type=click.Choice(["pyglet", "evdev"]),
+              default=DEFAULT_INPUT_BACKEND,
+              help="evdev (Linux only): read buttons on a dedicated thread with kernel timestamps, "
+                   "and award near-simultaneous buzzes to the earliest press.")
+@click.option("--arbitration-window-ms",
+              type=float,
+              default=DEFAULT_ARBITRATION_WINDOW_MS,
+              help="With --input-backend evdev, how long presses are collected before the earliest one wins.")
+@click.option("--evdev-device",
+              multiple=True,
+              help="With --input-backend evdev, use these event devices (or test pipes) instead of detected joysticks.")
+@click.option("--sfx-latency",
+              is_flag=True,
+              help="After each buzz, print how long it took from the press until play() returned for the sound "
+                   "effect. The audio driver's buffering and output latency are not measured.")
+@click.option("--metrics-file",
+              default=None,
+              help="Periodically write game metrics to this file: Prometheus text format if it ends with .prom, "
+                   "JSON lines otherwise. Press M in the control window to show them.")
+@click.option("--metrics-interval",
+              type=float,
+              default=DEFAULT_METRICS_INTERVAL,
+              help="How often the metrics file is written (in seconds).")
+@click.option("--record-events",
+              default=None,
+              help="Append every button press and release, with its timestamp, to this file (JSON lines).")
+@click.option("--replay-events",
+              default=None,
+              help="Replay presses recorded with --record-events into the game, report dropped, late and "
+                   "mis-attributed buzzes, then quit. No buzzer needs to be plugged in.")
+@click.option("--storm-rate",
+              type=float,
+              default=None,
+              help="Instead of a recording, replay random presses from all teams at this many presses per second.")
+@click.option("--storm-duration",
+              type=float,
+              default=30,
+              help="With --storm-rate, how long the storm lasts (in seconds).")
+@click.option("--replay-speed",
+              type=float,
+              default=1,
+              help="Replay speed: 1 for real time, 2 for twice as fast, 0 for as fast as possible.")
+@click.option("--late-ms",
+              type=float,
+              default=DEFAULT_LATE_MS,
+              help="While replaying, a press handled this long after it was made counts as late.")
+@click.option("--cover-atlas/--no-cover-atlas",
+              default=True,
+              help="Pack covers, scaled to --cover-size, into a few large textures cached on disk.")
+@click.option("--cover-size",
+              type=click.IntRange(1, COVER_ATLAS_MAX_COVER_SIZE),
+              default=None,
+              help="Size covers are scaled to in the atlas (in pixels). "
+                   "Defaults to their size on the largest connected screen, with the projector view full screen.")
+@click.option("--separate-display",
+              is_flag=True,
+              help="Run the projector view in its own process, fed through shared memory, "
+                   "so that nothing done on the control window can stall it.")
+@click.option("--displays",
+              type=int,
+              default=1,
+              help="With --separate-display, how many projector windows are opened.")
+@click.option("--watch",
+              is_flag=True,
+              help="Reload the playlist and teams files whenever they change during the game (F5 always does).")
+@click.option("--bench-file",
+              default=None,
+              help="Used by bench: play a scripted game with buzzes sent through --evdev-device, "
+                   "write measurements to this file and quit.")
+@click.option("--bench-duration",
+              type=float,
+              default=20,
+              help="With --bench-file, how long the scripted game lasts (in seconds).")
 def play(playlist_file,
          teams_file,
          answer_timer_duration,
          retry_mode,
          retry_timer_duration,
          pause_during_answers,
-         fadeout_factor):
+         fadeout_factor,
+         audio_cache_mb,
+         prefetch_radius,
+         pcm_cache_mb,
+         index_file,
+         frame_stats,
+         legacy_redraw,
+         idle_benchmark,
+         input_backend,
+         arbitration_window_ms,
+         evdev_device,
+         sfx_latency,
+         metrics_file,
+         metrics_interval,
+         record_events,
+         replay_events,
+         storm_rate,
+         storm_duration,
+         replay_speed,
+         late_ms,
+         cover_atlas,
+         cover_size,
+         separate_display,
+         displays,
+         watch,
+         bench_file,
+         bench_duration):
     """Play the game."""
 
     state.answer_timer_duration = answer_timer_duration
@@ -827,76 +3766,301 @@ def play(playlist_file,
     state.retry_timer_duration = retry_timer_duration
     state.pause_during_answers = pause_during_answers
     state.fadeout_factor = fadeout_factor
+    if evdev_device:
+        state.input_backend = "evdev"
+    elif replay_events or storm_rate:
+        state.input_backend = "virtual" # les appuis viennent du rejeu : aucun boîtier n'est nécessaire
+    else:
+        state.input_backend = input_backend
+    state.arbitration_window = arbitration_window_ms / 1000 if state.input_backend in ("evdev", "virtual") else 0
+    state.evdev_devices = evdev_device
+    if replay_events and not (recorded_events := load_recorded_events(replay_events)):
+        print(f"Aucun appui enregistré dans {replay_events}, rien à rejouer.")
+        sys.exit(1)
+    pcm_cache = PCMCache(cap_bytes=pcm_cache_mb * 1024 * 1024) if pcm_cache_mb else None
+    state.track_store = TrackStore(audio_cache_mb * 1024 * 1024, prefetch_radius, pcm_cache)
 
-    _ = state.joystick # Simple accès au joystick, pour l'initialiser et échouer s'il est absent 
+    _ = state.buzzers # Simple accès aux buzzers, pour les initialiser et échouer s'il n'y en a aucun
 
     with open(teams_file, "r") as f:
         lines = f.read().splitlines()
 
     for line in lines:
-        line = line.strip()
-        fields = line.split(":")
-        name, button_id = fields[0], int(fields[1])
-        if len(fields) == 3:
-            score = int(fields[2])
-        else:
-            score = 0
-        state.add_team(Team(name=name, score=score, button_id=button_id))
-
-    with open(playlist_file, "r") as f:
-        lines = f.read().splitlines()
-
-    for idx, line in enumerate(lines):
-        line = line.strip()
-        if "=" in line:
-            line = line.split("=")[0]
-        artist, title = line.split(" - ")
-        if "/" in artist:
-            artist = artist.split("/")[-1]
-        media = pg.media.load(os.path.join(TRACKS_DIR, f"{line}.mp3"), streaming=False)
-        cover = pg.image.load(os.path.join(COVERS_DIR, f"{line}.jpg")).get_texture()
-        track = Track(artist, title, media, cover)
-        state.tracks.append(track)
-        print(f"Piste {str(idx+1)}/{len(lines)} chargée ({line})")
-
-    buzzer_fx = pg.media.load(os.path.join(FX_DIR, BUZZER_FX), streaming=False)
-
-    gifs = []
-    gif_files = sorted(os.listdir(GIFS_DIR))
-    for idx, gif_file in enumerate(gif_files):
-        gif_name = gif_file[:-4]
-        gif_sprite = pg.sprite.Sprite(img=pg.resource.animation(os.path.join(GIFS_DIR, gif_file)))
-        gifs.append({"name":gif_name, "sprite":gif_sprite})
-        print(f"GIF {str(idx+1)}/{len(gif_files)} chargé ({gif_name})")
-    state.gifs = deque(gifs)
-
-    if state.tracks:
-        state.tracks[0].media.play().pause() # pour éviter un lag à la 1re piste
-
-    state.display_window = DisplayWindow()
+        if line.strip():
+            state.add_team(parse_team_line(line))
+
+    analysis_index = AnalysisIndex()
+    track_index = TrackIndex(index_file)
+    if not track_index.is_current(playlist_file):
+        print("Playlist modifiée, reconstruction de l'index...")
+        track_index.build(playlist_file, analysis_index)
+    rows, missing = track_index.validate(analysis_index)
+    if missing:
+        print("Fichiers manquants :")
+        for path in missing:
+            print(f"  {path}")
+        sys.exit(1)
+
+    for row in rows:
+        track = Track(row["artist"], row["title"])
+        apply_index_row(track, row)
+        state.track_store.add(track)
+    print(f"{len(state.tracks)} pistes dans la playlist, décodage à la demande")
+    if cover_atlas:
+        page_size = atlas_page_size()
+        cover_size = cover_size or default_cover_size(page_size)
+        if cover_size > page_size - COVER_ATLAS_PADDING:
+            print(f"--cover-size trop grand pour cette carte graphique : {page_size - COVER_ATLAS_PADDING} au plus.")
+            sys.exit(1)
+        state.track_store.atlas = CoverAtlas([track.cover_file for track in state.tracks], cover_size, page_size,
+                                             owner=playlist_file)
+    state.track_store.prefetch(state.track_number)
+
+    state.sound_effects = SoundEffects({"buzzer": BUZZER_FX, "success": SUCCESS_FX})
+
+    state.gifs = deque(gif_names()) # décodés par l'afficheur, à la demande
+    print(f"{len(state.gifs)} GIF disponibles")
+
+    pg.media.synthesis.Silence(0.1).play().pause() # pour éviter un lag à la 1re piste, sans attendre son décodage
+
+    if separate_display:
+        # l'afficheur tourne dans ses propres processus : un ralentissement du contrôleur ne fige plus le projecteur
+        publisher = SharedSnapshot()
+        publisher.publish()
+        display_processes = [subprocess.Popen([sys.executable, os.path.join(BASE_DIR, "blind.py"), "display",
+                                               "--shared-memory", publisher.memory.name, "--output", str(output)])
+                             for output in range(1, displays + 1)]
+        def close_displays():
+            for process in display_processes:
+                process.terminate()
+            publisher.close()
+        atexit.register(close_displays)
+        state.display_window = None
+        state.display_outputs = [publisher]
+    else:
+        state.display_window = DisplayWindow()
+        state.display_outputs = [state.display_window]
     state.control_window = ControlWindow()
-
-    @state.joystick.event
-    def on_joybutton_press(joystick, button_id):
+    windows = [window for window in (state.control_window, state.display_window) if window]
+
+    if frame_stats:
+        def print_frame_stats(dt):
+            for window in windows:
+                print(window.frame_timer.report())
+        pg.clock.schedule_interval(print_frame_stats, FRAME_STATS_INTERVAL)
+
+    if metrics_file:
+        pg.clock.schedule_interval_soft(lambda dt: state.metrics.write(metrics_file), metrics_interval)
+
+    state.reloader = PlaylistReloader(playlist_file, teams_file, index_file, cover_size if cover_atlas else None)
+    if watch:
+        pg.clock.schedule_interval_soft(state.reloader.check, RELOAD_CHECK_INTERVAL)
+
+    if not legacy_redraw:
+        pg.app.event_loop = Watched.event_loop = RedrawEventLoop()
+        pg.app.event_loop.publishers.extend(output for output in state.display_outputs if output is not state.display_window)
+    elif separate_display:
+        pg.clock.schedule_interval(publisher.publish, ANIMATION_FRAME_INTERVAL)
+
+    if idle_benchmark:
+        cpu_start, wall_start = process_time(), time()
+        def end_idle_benchmark(dt):
+            cpu, wall = process_time() - cpu_start, time() - wall_start
+            print(f"Boucle : {'pyglet' if legacy_redraw else 'à invalidation'}")
+            print(f"CPU : {cpu:.2f} s sur {wall:.1f} s ({100*cpu/wall:.1f} %)")
+            print("Images : " + ", ".join(f"{window.frame_timer.name} {window.frame_timer.count}" for window in windows))
+            pg.app.exit()
+        pg.clock.schedule_once(end_idle_benchmark, idle_benchmark)
+
+    if bench_file:
+        BenchScript(bench_file, bench_duration).start()
+
+    @state.buzzers.event
+    def on_buzzer_press(device, button_id, timestamp):
+        start = perf_counter()
+        handle_buzz(device, button_id, timestamp)
+        state.metrics.record_buzz(timestamp, perf_counter() - start)
+
+    def handle_buzz(device, button_id, timestamp):
         if state.selected_track.artist_revealed and state.selected_track.title_revealed:
             return
 
         if state.step == STEP_PLAYING:
-            if not (team_trying_to_buzz := state.get_team_by_button_id(button_id)):
+            if not (team_trying_to_buzz := state.get_team_by_button_id(device, button_id)):
                 return
             if team_trying_to_buzz.can_buzz:
+                previous_team = state.last_team_to_buzz
                 state.last_team_to_buzz = team_trying_to_buzz
             else:
                 return
-            buzzer_fx.play()
+            state.sound_effects.play("buzzer", pressed_at=timestamp)
+            if sfx_latency:
+                print(state.sound_effects.report())
             state.step = STEP_ANSWERING
+            state.start_answer_timer()
             state.toggle_pause()
-            if state.retry_mode == RETRY_MODE_ALTERNATING:
-                for team in state.teams:
-                    team.can_buzz = True
+            if state.retry_mode == RETRY_MODE_ALTERNATING and previous_team:
+                previous_team.can_buzz = True # en mode alterné, seule l'équipe précédente était bloquée
             state.last_team_to_buzz.can_buzz = False
-    
+
+    # après les gestionnaires du jeu, pour passer avant eux sans les remplacer
+    if record_events:
+        state.buzzers.push_handlers(EventRecorder(record_events))
+
+    if replay_events or storm_rate:
+        if replay_events:
+            events = recorded_events
+        else:
+            buttons = [(team.device, team.button_id) for team in state.teams]
+            events = storm_events(buttons, storm_rate, storm_duration)
+        ReplayMonitor(EventReplayer(state.buzzers, events, replay_speed), late_ms / 1000).start()
+
+    pg.app.run()
+
+@cli.command()
+@click.option("--shared-memory", "shared_memory_name", required=True, help="Shared memory published by play.")
+@click.option("--output", type=int, default=1, help="Number of this display, to tell several apart.")
+def display(shared_memory_name, output):
+    """Show the projector view of a game run by play --separate-display."""
+    snapshot = SharedSnapshot(shared_memory_name)
+    while not snapshot.poll(): # le jeu publie son premier instantané avant de lancer les afficheurs
+        sleep(SNAPSHOT_POLL_INTERVAL)
+    display_window = DisplayWindow(lambda: snapshot.snapshot, local=False, output=output)
+    parent = os.getppid()
+
+    def poll(dt):
+        if os.getppid() != parent: # le jeu s'est terminé sans nous arrêter
+            pg.app.exit()
+        elif snapshot.poll():
+            display_window.needs_redraw = True
+    pg.clock.schedule_interval(poll, SNAPSHOT_POLL_INTERVAL)
+
+    pg.app.event_loop = RedrawEventLoop()
     pg.app.run()
+    snapshot.close()
+
+@cli.command()
+@click.option("--tracks", type=int, default=20, help="How many synthetic tracks the playlist holds.")
+@click.option("--gifs", type=int, default=3, help="How many synthetic GIFs are loaded.")
+@click.option("--track-duration", type=int, default=30, help="Length of each synthetic track (in seconds).")
+@click.option("--duration", type=float, default=20, help="How long each scripted game lasts (in seconds).")
+@click.option("--runs", type=int, default=3, help="How many games are played; medians are reported.")
+@click.option("--output", default="bench.json", help="JSON file the results are written to.")
+@click.option("--xvfb/--no-xvfb", default=True, help="Run the game under xvfb-run, if it is installed.")
+@click.option("--keep-fixtures", is_flag=True, help="Keep the generated game directory and print its path.")
+def bench(tracks, gifs, track_duration, duration, runs, output, xvfb, keep_fixtures):
+    """Measure startup, frame times, memory and buzz latency of play on a synthetic game."""
+    directory = tempfile.mkdtemp(prefix="blind-bench-")
+    print(f"Génération de {tracks} pistes et {gifs} GIF dans {directory}...")
+    create_bench_fixtures(directory, tracks, gifs, track_duration)
+
+    command = [sys.executable, os.path.join(BASE_DIR, "blind.py"), "play", "--input-backend", "evdev",
+               "--retry-mode", "alternating", "--bench-duration", str(duration)]
+    if xvfb and shutil.which("xvfb-run"):
+        command = ["xvfb-run", "-a", "-s", "-screen 0 1920x1080x24"] + command
+    env = {**os.environ, "PYGLET_AUDIO": "silent"} # aucun son, et aucune dépendance à la carte son de la machine
+
+    results = []
+    for run in range(runs):
+        device = FakeEvdevDevice(directory) # un tube neuf par partie, que le jeu lit et dans lequel il écrit
+        bench_file = os.path.join(directory, f"run{run+1}.json")
+        started = time()
+        try:
+            subprocess.run(command + ["--evdev-device", device.path, "--bench-file", bench_file],
+                           cwd=directory, env=env, check=True, timeout=duration + 120)
+        finally:
+            device.close()
+        with open(bench_file, "r") as f:
+            child = json.load(f)
+        metrics = child["metrics"]
+        result = {"startup_seconds": round(max(child["first_frames"].values()) - started, 3),
+                  "peak_rss_bytes": child["peak_rss_bytes"],
+                  "frame_ms": metrics["frames"],
+                  "buzz_to_state_ms": metrics["buzz_latency"],
+                  "buzz_handling_ms": metrics["buzz_handling"],
+                  "buzz_to_frame_ms": child["buzz_to_frame"],
+                  "track_load_ms": metrics["track_load"],
+                  "track_stall_ms": metrics["track_stall"],
+                  "tracks_played": child["tracks_played"],
+                  "buzzes": child["buzzes"]}
+        results.append(result)
+        print(f"Partie {run+1}/{runs} : démarrage {result['startup_seconds']:.2f} s, "
+              f"mémoire {result['peak_rss_bytes'] / 1024**2:.0f} Mo, {result['buzzes']} buzz")
+
+    def median(values):
+        values = sorted(value for value in values if value is not None)
+        return values[len(values)//2] if values else None
+
+    summary = {"startup_seconds": median(result["startup_seconds"] for result in results),
+               "peak_rss_bytes": median(result["peak_rss_bytes"] for result in results),
+               "buzz_to_state_p95_ms": median(result["buzz_to_state_ms"].get("p95") for result in results),
+               "buzz_to_frame_p95_ms": median(result["buzz_to_frame_ms"].get("p95") for result in results),
+               "track_load_p95_ms": median(result["track_load_ms"].get("p95") for result in results)}
+    summary["frame_p95_ms"] = {name: median(result["frame_ms"][name].get("p95") for result in results)
+                               for name in results[0]["frame_ms"]}
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        commit = None
+    with open(output, "w") as f:
+        json.dump({"commit": commit,
+                   "date": datetime.now().isoformat(timespec="seconds"),
+                   "parameters": {"tracks": tracks, "gifs": gifs, "track_duration": track_duration,
+                                  "duration": duration, "runs": runs},
+                   "summary": summary,
+                   "runs": results}, f, indent=2)
+
+    for key, value in summary.items():
+        print(f"  {key} : {value}")
+    print(f"Résultats écrits dans {output}")
+    if keep_fixtures:
+        print(f"Partie conservée dans {directory}")
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
+
+@cli.group()
+def cache():
+    """Manage the on-disk cache of decoded tracks and cover atlas pages."""
+    pass
+
+@cache.command()
+@click.option("--pcm-cache-mb",
+              type=int,
+              default=DEFAULT_PCM_CACHE_MB,
+              help="Size cap of the on-disk cache of decoded tracks (in MB).")
+def stats(pcm_cache_mb):
+    """Show what the cache holds."""
+    pcm_cache = PCMCache(cap_bytes=pcm_cache_mb * 1024 * 1024)
+    entries = pcm_cache.entries()
+    total = sum(size for _, size, _ in entries)
+    print(f"Dossier : {pcm_cache.directory}")
+    print(f"Pistes : {len(entries)}")
+    if pcm_cache.cap_bytes:
+        print(f"Taille : {total / 1024 / 1024:.0f} Mo / {pcm_cache_mb} Mo ({100 * total / pcm_cache.cap_bytes:.0f} %)")
+    else:
+        print(f"Taille : {total / 1024 / 1024:.0f} Mo (cache désactivé)")
+    duration = 0
+    for path, size, _ in entries:
+        with open(path, "rb") as f:
+            _, channels, sample_size, sample_rate = PCM_HEADER.unpack(f.read(PCM_HEADER.size))
+        duration += (size - PCM_HEADER.size) / (channels * (sample_size >> 3) * sample_rate)
+    print(f"Durée : {int(duration // 60)} min")
+    if entries:
+        print(f"Plus ancienne utilisation : {datetime.fromtimestamp(entries[0][2]):%Y-%m-%d %H:%M}")
+
+@cache.command()
+def clear():
+    """Delete every cached track and cover atlas page."""
+    pcm_cache = PCMCache()
+    count = len(pcm_cache.entries())
+    pcm_cache.clear()
+    print(f"{count} pistes supprimées du cache.")
+    if os.path.isdir(COVER_ATLAS_DIR):
+        pages = len([name for name in os.listdir(COVER_ATLAS_DIR) if name.endswith(".npz")])
+        shutil.rmtree(COVER_ATLAS_DIR)
+        print(f"{pages} pages de l'atlas des pochettes supprimées.")
 
 # Exécution principale
 ######################
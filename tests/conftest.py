@@ -0,0 +1,10 @@
+import os
+import sys
+
+import pyglet
+
+# ni écran ni carte son pendant les tests
+pyglet.options["shadow_window"] = False
+pyglet.options["audio"] = ("silent",)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
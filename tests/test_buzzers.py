@@ -0,0 +1,72 @@
+import time
+
+import blind
+
+
+class RecordingHub:
+    # remplaçant de BuzzerHub : garde les événements au lieu de les distribuer
+    def __init__(self):
+        self.events = []
+
+    def dispatch_event(self, event_type, *args):
+        self.events.append((event_type, *args))
+
+
+def test_arbiter_without_window_dispatches_immediately():
+    hub = RecordingHub()
+    arbiter = blind.BuzzArbiter(hub, 0)
+    arbiter.press(10.0, 1, 3)
+    assert hub.events == [("on_buzzer_press", 1, 3, 10.0)]
+
+
+def test_arbiter_awards_earliest_timestamp(monkeypatch):
+    monkeypatch.setattr(blind.pg.clock, "schedule_once", lambda *args: None)
+    hub = RecordingHub()
+    arbiter = blind.BuzzArbiter(hub, 0.015)
+    # arrivés dans le désordre, comme le thread de lecture peut les poster
+    arbiter.press(10.004, 2, 0)
+    arbiter.press(10.001, 1, 5)
+    arbiter.press(10.009, 1, 2)
+    assert hub.events == []
+    arbiter.decide(0.015)
+    assert [event[1:3] for event in hub.events] == [(1, 5), (2, 0), (1, 2)]
+    assert arbiter.pending == []
+
+
+def test_evdev_reader_reads_fake_device(tmp_path, monkeypatch):
+    posted = []
+    monkeypatch.setattr(blind.pg.app.platform_event_loop, "post_event", lambda *args: posted.append(args[1:]))
+    device = blind.FakeEvdevDevice(directory=str(tmp_path))
+    reader = blind.EvdevReader(hub=None)
+    reader.add(2, device.path)
+    reader.start()
+    device.press(4, timestamp=1000.25)
+
+    deadline = time.monotonic() + 2
+    while len(posted) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    device.close()
+    assert posted == [("on_buzzer_raw", 1000.25, 2, 4, True), ("on_buzzer_raw", 1000.25, 2, 4, False)]
+
+
+def test_virtual_hub_needs_no_device(tmp_path):
+    hub = blind.BuzzerHub("virtual", devices_file=str(tmp_path / "devices.json"))
+    assert hub.joysticks == {}
+    presses = []
+    hub.push_handlers(on_buzzer_press=lambda *args: presses.append(args))
+    hub.dispatch_event("on_buzzer_raw", 5.0, 2, 1, True)
+    hub.dispatch_event("on_buzzer_raw", 5.1, 2, 1, False)
+    assert presses == [(2, 1, 5.0)]
+
+
+def test_recorded_events_start_at_zero(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text('{"time": 12.5, "device": 1, "button": 3, "pressed": false}\n'
+                    '{"time": 12.0, "device": 1, "button": 3, "pressed": true}\n\n')
+    assert blind.load_recorded_events(str(path)) == [(0, 1, 3, True), (0.5, 1, 3, False)]
+
+
+def test_empty_recording_has_no_events(tmp_path):
+    path = tmp_path / "events.jsonl"
+    path.write_text("\n")
+    assert blind.load_recorded_events(str(path)) == []
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+import blind
+
+
+def test_scale_pixels_fits_and_centers():
+    pixels = np.full((100, 200, 4), 255, dtype=np.uint8)
+    scaled = blind.scale_pixels(pixels, 50)
+    assert scaled.shape == (50, 50, 4)
+    assert scaled[25, 25, 3] == 255 # image au centre
+    assert scaled[0, 25, 3] == 0 # bandes transparentes au-dessus et en dessous
+
+
+def test_atlas_rejects_covers_larger_than_a_page(tmp_path):
+    with pytest.raises(ValueError):
+        blind.CoverAtlas([], 63, 64, directory=str(tmp_path))
+
+
+def built(atlas):
+    # toutes les pages construites, puis le thread arrêté : l'élagage peut être appelé sans concurrence
+    for ready in atlas.ready:
+        assert ready.wait(5)
+    atlas.close()
+    atlas._worker.join(5)
+    return atlas
+
+
+def test_pages_are_packed_and_compressed(tmp_path):
+    atlas = built(blind.CoverAtlas([f"missing{i}.png" for i in range(5)], 10, 32, directory=str(tmp_path)))
+    assert (atlas.columns, atlas.per_page) == (2, 4)
+    assert all(path.endswith(".npz") for path in atlas.paths)
+    assert atlas._read(0).shape == (24, 24, 4)
+    assert atlas._read(1).shape == (12, 24, 4) # dernière page : une seule rangée
+
+
+def test_prune_drops_only_this_playlists_stale_pages(tmp_path):
+    directory = str(tmp_path / "atlas")
+    other = built(blind.CoverAtlas(["b.png"], 10, 32, directory=directory, owner="b.txt"))
+    old = built(blind.CoverAtlas(["a.png"], 10, 32, directory=directory, owner="a.txt"))
+    other.prune()
+    old.prune()
+    new = built(blind.CoverAtlas(["a.png"], 12, 32, directory=directory, owner="a.txt"))
+    new.prune()
+    pages = {name for name in os.listdir(directory) if name.endswith(".npz")}
+    assert pages == {os.path.basename(other.paths[0]), os.path.basename(new.paths[0])}
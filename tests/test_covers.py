@@ -0,0 +1,135 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import blind
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, json_data=None, content=b"", headers=None):
+        self.status_code = status_code
+        self._json = json_data
+        self.content = content
+        self.headers = headers or {}
+
+    def json(self):
+        return self._json
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    # remplaçant de requests.Session : réponses préparées, requêtes gardées
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = []
+
+    def get(self, url, timeout=None, params=None, headers=None):
+        self.calls.append((url, params, headers))
+        return self.responses.pop(0)
+
+
+def make_fetcher(tmp_path, responses, offline=False):
+    cache = blind.CoverLookupCache(path=str(tmp_path / "covers.json"))
+    session = FakeSession(responses)
+    fetcher = blind.CoverFetcher(session, cache, "http://search", offline, image_dir=str(tmp_path / "images"))
+    return fetcher, session
+
+
+def test_lookup_is_cached_across_runs(tmp_path):
+    search = FakeResponse(json_data={"results": [{"artworkUrl100": "http://img/100x100bb.jpg"}]})
+    fetcher, session = make_fetcher(tmp_path, [search])
+    assert fetcher.lookup("A - a")["url"] == f"http://img/{blind.COVER_SIZE}x{blind.COVER_SIZE}bb.jpg"
+
+    fetcher, session = make_fetcher(tmp_path, [])
+    assert fetcher.lookup("A - a")["url"].startswith("http://img/")
+    assert session.calls == []
+
+
+def test_lookup_miss_expires_sooner(tmp_path, monkeypatch):
+    fetcher, _ = make_fetcher(tmp_path, [FakeResponse(json_data={"results": []})])
+    assert fetcher.lookup("A - a")["url"] is None
+    later = blind.time() + blind.COVER_MISS_TTL + 1
+    monkeypatch.setattr(blind, "time", lambda: later)
+    assert fetcher.lookup_cache.get("A - a") is None
+    assert fetcher.lookup_cache.get("A - a", offline=True)["url"] is None
+
+
+def test_image_is_revalidated_with_its_etag(tmp_path, monkeypatch):
+    fetcher, session = make_fetcher(tmp_path, [FakeResponse(content=b"jpeg", headers={"ETag": "v1"}),
+                                               FakeResponse(status_code=304)])
+    fetcher.lookup_cache.update("A - a", url="http://img/a.jpg", checked=blind.time())
+    path = fetcher.image("A - a", fetcher.lookup_cache.get("A - a"))
+    assert open(path, "rb").read() == b"jpeg"
+
+    later = blind.time() + blind.COVER_LOOKUP_TTL + 1
+    monkeypatch.setattr(blind, "time", lambda: later)
+    assert fetcher.image("A - a", fetcher.lookup_cache.get("A - a", offline=True)) == path
+    assert session.calls[1][2] == {"If-None-Match": "v1"}
+    assert fetcher.requests == 2
+
+
+def test_offline_without_cache_fails(tmp_path):
+    fetcher, _ = make_fetcher(tmp_path, [], offline=True)
+    with pytest.raises(RuntimeError):
+        fetcher.lookup("A - a")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # une recherche à la iTunes et son image, avec ETag
+    def do_GET(self):
+        self.server.paths.append(self.path.split("?")[0])
+        if self.path.startswith("/search"):
+            artwork = f"http://127.0.0.1:{self.server.server_port}/art/100x100bb.jpg"
+            self.reply(200, json.dumps({"results": [{"artworkUrl100": artwork}]}).encode())
+        elif self.headers.get("If-None-Match") == "v1":
+            self.reply(304)
+        else:
+            self.reply(200, b"jpeg", ETag="v1")
+
+    def reply(self, status, body=b"", **headers):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    monkeypatch.setenv("NO_PROXY", "127.0.0.1")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.paths = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_against_a_stub_server_then_from_cache(tmp_path, monkeypatch, stub_server):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / blind.COVERS_DIR).mkdir()
+    (tmp_path / "work").mkdir()
+    search_url = f"http://127.0.0.1:{stub_server.server_port}/search"
+
+    def fetch():
+        cache = blind.CoverLookupCache(path="covers.json")
+        fetcher = blind.CoverFetcher(blind.http_session(), cache, search_url, image_dir="images")
+        fetcher.fetch("A - a", str(tmp_path / "work"))
+        return fetcher
+
+    assert fetch().requests == 2
+    assert stub_server.paths == ["/search", f"/art/{blind.COVER_SIZE}x{blind.COVER_SIZE}bb.jpg"]
+    assert (tmp_path / blind.COVERS_DIR / "A - a.jpg").read_bytes() == b"jpeg"
+
+    (tmp_path / blind.COVERS_DIR / "A - a.jpg").unlink()
+    assert fetch().requests == 0 # recherche et image servies par le cache
+    assert len(stub_server.paths) == 2
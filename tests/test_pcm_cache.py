@@ -0,0 +1,42 @@
+import os
+import wave
+
+import blind
+
+
+def write_pcm(path, size, mtime):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    os.utime(path, (mtime, mtime))
+
+
+def test_trim_drops_least_recently_used(tmp_path):
+    cache = blind.PCMCache(directory=str(tmp_path), cap_bytes=250)
+    for name, mtime in (("old", 1), ("middle", 2), ("new", 3)):
+        write_pcm(tmp_path / f"{name}.pcm", 100, mtime)
+    cache.trim()
+    assert sorted(os.listdir(tmp_path)) == ["middle.pcm", "new.pcm"]
+
+
+def test_trim_keeps_the_track_being_loaded(tmp_path):
+    cache = blind.PCMCache(directory=str(tmp_path), cap_bytes=150)
+    write_pcm(tmp_path / "kept.pcm", 100, 1)
+    write_pcm(tmp_path / "other.pcm", 100, 2)
+    cache.trim(keep=str(tmp_path / "kept.pcm"))
+    assert os.listdir(tmp_path) == ["kept.pcm"]
+
+
+def test_load_decodes_once_then_maps(tmp_path):
+    audio_file = str(tmp_path / "track.wav")
+    with wave.open(audio_file, "wb") as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(8000)
+        f.writeframes(b"\0" * 8000 * 4)
+    cache = blind.PCMCache(directory=str(tmp_path / "pcm"))
+    source = cache.load(audio_file)
+    assert isinstance(source, blind.MappedSource)
+    assert abs(source.duration - 1) < 0.01
+    assert len(cache.entries()) == 1
+    assert cache.load(audio_file).duration == source.duration
+    assert len(cache.entries()) == 1
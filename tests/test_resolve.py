@@ -0,0 +1,70 @@
+import json
+
+from click.testing import CliRunner
+
+import blind
+
+
+RECORDED = {"A - One": {"video_id": "aaa", "duration": 181.0, "title": "One"},
+            "B - Two": None}
+
+
+def recording(tmp_path, results=RECORDED):
+    path = tmp_path / "searches.json"
+    path.write_text(json.dumps(results))
+    return blind.recorded_search(str(path))
+
+
+def test_resolver_searches_only_what_the_cache_lacks(tmp_path):
+    cache = blind.SearchCache(path=str(tmp_path / "cache" / "searches.json"))
+    cache.update("C - Three", video_id="ccc")
+    resolver = blind.SearchResolver(recording(tmp_path), cache=cache, jobs=2)
+    resolved = resolver.resolve(["A - One", "B - Two", "C - Three"])
+    assert resolved["A - One"]["video_id"] == "aaa"
+    assert resolved["B - Two"] is None
+    assert resolved["C - Three"]["video_id"] == "ccc"
+    assert resolver.searches == 2
+    reloaded = blind.SearchCache(path=cache.path)
+    assert reloaded.get("A - One")["video_id"] == "aaa"
+    assert reloaded.get("B - Two") is None
+
+
+def test_refresh_searches_cached_tracks_again(tmp_path):
+    cache = blind.SearchCache(path=None)
+    cache.update("A - One", video_id="old")
+    resolver = blind.SearchResolver(recording(tmp_path), cache=cache)
+    assert resolver.resolve(["A - One"], refresh=True)["A - One"]["video_id"] == "aaa"
+    assert resolver.searches == 1
+
+
+def test_offline_resolver_uses_the_cache_only(tmp_path):
+    cache = blind.SearchCache(path=None)
+    cache.update("A - One", video_id="aaa")
+    resolver = blind.SearchResolver(None, cache=cache)
+    assert resolver.resolve(["A - One", "B - Two"]) == {"A - One": cache.get("A - One"), "B - Two": None}
+    assert resolver.searches == 0
+
+
+def test_memory_cache_writes_nothing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    blind.SearchCache(path=None).update("A - One", video_id="aaa")
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_write_back_fills_lines_without_video_id(tmp_path):
+    playlist = tmp_path / "playlist.txt"
+    playlist.write_text("A - One\nB - Two\n\nC - Three=ccc\n")
+    resolved = {"A - One": {"video_id": "aaa"}, "B - Two": None, "C - Three": {"video_id": "zzz"}}
+    assert blind.write_back_video_ids(str(playlist), resolved) == 1
+    assert playlist.read_text() == "A - One=aaa\nB - Two\n\nC - Three=ccc\n"
+
+
+def test_recorded_resolve_leaves_the_real_cache_alone(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "playlist.txt").write_text("A - One\nB - Two\n")
+    (tmp_path / "recorded.json").write_text(json.dumps(RECORDED))
+    result = CliRunner().invoke(blind.cli, ["resolve", "--recorded-searches", "recorded.json"])
+    assert result.exit_code == 0, result.output
+    assert "A - One -> aaa (One, 3:01)" in result.output
+    assert "2 recherches" in result.output
+    assert not (tmp_path / "cache").exists()
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+import blind
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return blind.BlobStore()
+
+
+def add_track(store, track, content):
+    audio_file = f"{track}.download.mp3"
+    with open(audio_file, "wb") as f:
+        f.write(content)
+    return store.add(track, audio_file)
+
+
+def test_identical_audio_is_stored_once(store):
+    blob = add_track(store, "A - One", b"same")
+    assert add_track(store, "B - Two", b"same") == blob
+    assert os.listdir(store.blobs_dir) == [blob]
+    assert sorted(store.names_for(blob)) == ["A - One", "B - Two"]
+    assert os.path.islink(os.path.join(blind.TRACKS_DIR, "B - Two.mp3"))
+
+
+def test_diff_sorts_playlist_against_store(store):
+    blob = add_track(store, "A - One", b"one")
+    add_track(store, "B - Two", b"two")
+    store.videos["abc"] = blob
+    with open(os.path.join(blind.TRACKS_DIR, "C - Three.mp3"), "wb") as f:
+        f.write(b"three")
+    changes = store.diff([("A - One", None), ("A - Renamed", "abc"), ("C - Three", None), ("D - Four", "xyz")])
+    assert changes == {"unchanged": ["A - One"],
+                       "adopt": ["C - Three"],
+                       "relink": ["A - Renamed"],
+                       "new": ["D - Four"],
+                       "removed": ["B - Two"]}
+
+
+def test_garbage_collect_drops_unreferenced_blobs(store):
+    kept = add_track(store, "A - One", b"one")
+    dropped = add_track(store, "B - Two", b"two!")
+    store.link("A - Copy", kept, video_id="kept")
+    store.videos["dropped"] = dropped
+    store.unlink("B - Two")
+    store.unlink("A - One")
+    assert store.garbage_collect() == (1, 4)
+    assert os.listdir(store.blobs_dir) == [kept]
+    assert store.videos == {"kept": kept}
+    assert not os.path.lexists(os.path.join(blind.TRACKS_DIR, "B - Two.mp3"))
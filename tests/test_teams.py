@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+
+import pytest
+
+import blind
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("Rouges:3", ("Rouges", 0, 3, 1)),
+    ("Bleus:2@2", ("Bleus", 0, 2, 2)),
+    ("Verts:5@3:12\n", ("Verts", 12, 5, 3)),
+])
+def test_parse_team_line(line, expected):
+    team = blind.parse_team_line(line)
+    assert (team.name, team.score, team.button_id, team.device) == expected
+
+
+def test_parse_team_line_rejects_a_missing_button():
+    with pytest.raises(IndexError):
+        blind.parse_team_line("Jaunes")
+
+
+@pytest.fixture
+def game(monkeypatch, tmp_path):
+    state = blind.State()
+    monkeypatch.setattr(blind, "state", state, raising=False)
+    for line in ("Alpha:1", "B:2", "C:3"):
+        state.add_team(blind.parse_team_line(line))
+    state.pause_during_answers = False
+    reloader = blind.PlaylistReloader(str(tmp_path / "playlist.txt"), str(tmp_path / "teams.txt"))
+    return state, reloader
+
+
+def names(state):
+    return [team.name for team in state.teams]
+
+
+def test_renamed_team_keeps_its_score(game):
+    state, reloader = game
+    state.get_team_by_button_id(1, 2).score = 4
+    reloader.merge_teams([blind.parse_team_line(line) for line in ("Alpha:1", "Bravo:2", "C:3")])
+    assert [(team.name, team.score) for team in state.teams] == [("Bravo", 4), ("Alpha", 0), ("C", 0)]
+
+
+def test_team_moved_to_another_button_keeps_its_score(game):
+    state, reloader = game
+    state.get_team_by_button_id(1, 3).score = 2
+    reloader.merge_teams([blind.parse_team_line(line) for line in ("Alpha:1", "B:2", "C:7")])
+    assert state.get_team_by_button_id(1, 7).score == 2
+
+
+def test_dropped_answering_team_leaves_the_leaderboard_alone(game):
+    state, reloader = game
+    alpha = state.get_team_by_button_id(1, 1)
+    state.last_team_to_buzz = alpha
+    state.step = blind.STEP_ANSWERING
+    state.player = SimpleNamespace(volume=0) # coupé pendant la réponse
+    state.track_store = SimpleNamespace(tracks=[SimpleNamespace(gain=1)])
+    reloader.merge_teams([blind.parse_team_line(line) for line in ("B:2", "C:3")])
+    assert state.last_team_to_buzz is None
+    assert state.step == blind.STEP_PLAYING
+    assert state.player.volume == 1
+    alpha.score += 1
+    assert names(state) == ["B", "C"]
@@ -0,0 +1,72 @@
+import threading
+from types import SimpleNamespace
+
+import blind
+
+
+class GatedCache:
+    # remplaçant de PCMCache : chaque chargement attend qu'on ouvre la porte
+    def __init__(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+
+    def load(self, audio_file, audio_hash=None):
+        self.started.set()
+        self.gate.wait()
+        return SimpleNamespace(audio_file=audio_file, duration=1, audio_format=SimpleNamespace(bytes_per_second=10))
+
+
+def make_store(*names):
+    store = blind.TrackStore(budget_bytes=1000, pcm_cache=GatedCache())
+    store.atlas = SimpleNamespace(prefetch=lambda index: None) # pas de pochette à charger
+    tracks = [blind.Track(name, name, audio_file=f"{name}.mp3") for name in names]
+    for track in tracks:
+        store.add(track)
+    return store, tracks
+
+
+def load_during_replace(store, track, new_tracks, changed=()):
+    loading = store._loading[track] = threading.Event()
+    thread = threading.Thread(target=store._load, args=(track, loading))
+    thread.start()
+    store.pcm_cache.started.wait()
+    store.replace(new_tracks, changed)
+    store.pcm_cache.gate.set()
+    thread.join()
+
+
+def test_load_of_a_removed_track_is_dropped():
+    store, (one, two) = make_store("one", "two")
+    load_during_replace(store, two, [one])
+    assert two not in store._media
+    assert store.resident_bytes == 0
+
+
+def test_load_of_a_changed_track_is_dropped():
+    store, (one,) = make_store("one")
+    load_during_replace(store, one, [one], changed=[one])
+    assert one not in store._media
+
+
+def test_load_of_a_kept_track_survives_a_replace():
+    store, (one, two) = make_store("one", "two")
+    load_during_replace(store, one, [one, two])
+    assert store._media[one].audio_file == "one.mp3"
+
+
+def test_budget_counts_every_loaded_track():
+    store, (one, two) = make_store("one", "two")
+    store.budget_bytes = 15
+    store.pcm_cache.gate.set()
+    assert store.get_media(one).audio_file == "one.mp3"
+    assert store.get_media(two).audio_file == "two.mp3"
+    assert list(store._media) == [two]
+    assert store.resident_bytes == 10
+
+
+def test_track_evicted_as_soon_as_loaded_is_still_returned():
+    store, (one,) = make_store("one")
+    store.budget_bytes = 0
+    store.pcm_cache.gate.set()
+    assert store.get_media(one).audio_file == "one.mp3"
+    assert not store._media